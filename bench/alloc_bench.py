@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Micro-benchmark of the conversion loop.
+
+Compares RuleTable.convert_into, the conversion loop shared by the live
+composition and the transducer compiler, with the loop it replaced, which
+sliced the input for every rule length and built the result with +=.
+For each input it reports the time and the memory blocks allocated per
+converted character. CPython keeps no running count of allocations, and
+a temporary that is freed at once leaves no trace in a tracemalloc
+snapshot, so while the blocks are counted a line tracer keeps every value
+the loop binds to a local variable alive; the blocks allocated by the
+lines of the loop are then counted in the snapshot.
+"""
+
+import dis
+import os
+import sys
+import time
+import tracemalloc
+
+# Add the engine directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "engine"))
+
+from composer import get_rule_table, X_M, X_F, X_MM, X_MF
+
+INPUTS = [
+    ("word", "delgereh"),
+    ("preedit", "Ulaanbaataryn'hothondoo'rshinjilgeenii'ajilhiijbaina"),
+    ("paragraph", " ".join(["Mongol hel", "buuz id'ye", "ene bol sain baina uu"] * 200)),
+]
+
+def legacy_convert(table, text):
+    """The conversion loop before it matched in place and joined its output"""
+    if not text:
+        return ""
+
+    result = ""
+    word_flags = X_M
+
+    i = 0
+    while i < len(text):
+        matched = False
+
+        for length in table.rule_lengths:
+            if i + length > len(text):
+                continue
+
+            substr = text[i:i+length]
+
+            for rule in table.rules:
+                if rule.from_str == substr and (word_flags & rule.flags) == word_flags:
+                    result += rule.to_str
+
+                    if rule.flags & X_MF:
+                        word_flags = X_F
+                    elif rule.flags & X_MM:
+                        word_flags = X_M
+
+                    i += length
+                    matched = True
+                    break
+
+            if matched:
+                break
+
+        if not matched:
+            result += text[i]
+            i += 1
+
+    return result
+
+def loop_convert(table, text):
+    """Convert with the shared conversion loop, the way the composer does"""
+    out = []
+    table.convert_into(text, 0, len(text), X_M, out)
+    return "".join(out)
+
+def count_blocks(func, text, functions):
+    """
+    Count the memory blocks that a conversion allocates in some functions
+
+    Args:
+        func: The conversion function
+        text: The text to convert
+        functions: The functions whose allocations are counted
+
+    Returns:
+        The number of blocks allocated by the lines of the functions
+    """
+    codes = {f.__code__ for f in functions}
+    lines = {(code.co_filename, line) for code in codes
+             for _, line in dis.findlinestarts(code)}
+
+    # Values kept alive, so that the blocks of temporaries are still in the
+    # snapshot
+    kept = []
+    def trace_lines(frame, event, arg):
+        kept.extend(frame.f_locals.values())
+        return trace_lines
+    def trace_calls(frame, event, arg):
+        return trace_lines if frame.f_code in codes else None
+
+    tracemalloc.start()
+    try:
+        sys.settrace(trace_calls)
+        try:
+            func(text)
+        finally:
+            sys.settrace(None)
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    return sum(1 for trace in snapshot.traces
+               if (trace.traceback[0].filename, trace.traceback[0].lineno) in lines)
+
+def measure(func, text, repeat, functions):
+    """
+    Measure a conversion function
+
+    Returns:
+        A tuple (nanoseconds per character, blocks allocated per character)
+    """
+    # Timing without the tracer and tracemalloc, which slow everything down
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(text)
+    elapsed = time.perf_counter() - start
+
+    blocks = count_blocks(func, text, functions)
+    return elapsed / repeat / len(text) * 1e9, blocks / len(text)
+
+def main():
+    table = get_rule_table()
+
+    print(f"{'Input':<10} {'Chars':>6} {'Before ns/ch':>13} {'After ns/ch':>12}"
+          f" {'Before blk/ch':>14} {'After blk/ch':>13}")
+    print("-" * 72)
+    for name, text in INPUTS:
+        assert legacy_convert(table, text) == loop_convert(table, text)
+        repeat = max(1, 20000 // len(text))
+        before_ns, before_blocks = measure(lambda t: legacy_convert(table, t), text, repeat,
+                                           (legacy_convert,))
+        after_ns, after_blocks = measure(lambda t: loop_convert(table, t), text, repeat,
+                                         (loop_convert, type(table).convert_into))
+        print(f"{name:<10} {len(text):>6} {before_ns:>13.0f} {after_ns:>12.0f}"
+              f" {before_blocks:>14.2f} {after_blocks:>13.2f}")
+
+if __name__ == "__main__":
+    main()
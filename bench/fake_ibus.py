@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A stand-in for the parts of gi.repository.IBus that the engine uses, so
+that BuuzEngine can run without PyGObject or an IBus daemon.
+
+Call install() before importing the engine module.
+"""
+
+import collections
+import sys
+import types
+
+# Key values and modifier masks, as defined by IBus
+KEY_BackSpace = 0xff08
+KEY_Tab = 0xff09
+KEY_Return = 0xff0d
+KEY_Escape = 0xff1b
+KEY_F9 = 0xffc6
+KEY_Home = 0xff50
+KEY_Left = 0xff51
+KEY_Up = 0xff52
+KEY_Right = 0xff53
+KEY_Down = 0xff54
+KEY_End = 0xff57
+KEY_KP_Enter = 0xff8d
+KEY_Shift_L = 0xffe1
+KEY_Shift_R = 0xffe2
+KEY_Control_L = 0xffe3
+KEY_Control_R = 0xffe4
+KEY_Caps_Lock = 0xffe5
+KEY_Alt_L = 0xffe9
+KEY_Alt_R = 0xffea
+KEY_Super_L = 0xffeb
+KEY_Super_R = 0xffec
+KEY_space = 0x0020
+
+class ModifierType:
+    SHIFT_MASK = 1 << 0
+    LOCK_MASK = 1 << 1
+    CONTROL_MASK = 1 << 2
+    MOD1_MASK = 1 << 3
+    MOD2_MASK = 1 << 4
+    RELEASE_MASK = 1 << 30
+
+class Capabilite:
+    SURROUNDING_TEXT = 1 << 5
+
+class InputPurpose:
+    FREE_FORM = 0
+    ALPHA = 1
+    DIGITS = 2
+    NUMBER = 3
+    PHONE = 4
+    URL = 5
+    EMAIL = 6
+    NAME = 7
+    PASSWORD = 8
+    PIN = 9
+
+class AttrType:
+    UNDERLINE = 1
+
+class AttrUnderline:
+    SINGLE = 1
+
+class Attribute:
+    def __init__(self, type, value, start_index, end_index):
+        self.type = type
+        self.value = value
+        self.start_index = start_index
+        self.end_index = end_index
+
+    @classmethod
+    def new(cls, type, value, start_index, end_index):
+        return cls(type, value, start_index, end_index)
+
+class AttrList:
+    def __init__(self):
+        self.attributes = []
+
+    def append(self, attr):
+        self.attributes.append(attr)
+
+class Text:
+    def __init__(self, text):
+        self.text = text
+        self.attributes = None
+
+    @classmethod
+    def new_from_string(cls, text):
+        return cls(text)
+
+    def get_text(self):
+        return self.text
+
+    def set_attributes(self, attrs):
+        self.attributes = attrs
+
+class LookupTable:
+    def __init__(self, page_size, cursor_pos, cursor_visible, round):
+        self.candidates = []
+
+    @classmethod
+    def new(cls, page_size, cursor_pos, cursor_visible, round):
+        return cls(page_size, cursor_pos, cursor_visible, round)
+
+    def append_candidate(self, text):
+        self.candidates.append(text)
+
+class Engine:
+    """
+    Records what the engine sends to IBus instead of sending it. Each of
+    these calls would be one D-Bus message to the IBus daemon; `calls`
+    counts them by method name.
+    """
+    def __init__(self):
+        self.preedit_text = ""
+        self.preedit_visible = False
+        self.committed = []
+        self.candidates = []
+        # The client's text around the cursor, as (text, cursor position,
+        # selection anchor position)
+        self.surrounding_text = ("", 0, 0)
+        self.calls = collections.Counter()
+
+    def update_preedit_text(self, text, cursor_pos, visible):
+        self.calls['update_preedit_text'] += 1
+        self.preedit_text = text.get_text()
+        self.preedit_visible = visible
+
+    def hide_preedit_text(self):
+        self.calls['hide_preedit_text'] += 1
+        self.preedit_visible = False
+
+    def update_lookup_table(self, table, visible):
+        self.calls['update_lookup_table'] += 1
+        self.candidates = [text.get_text() for text in table.candidates]
+
+    def hide_lookup_table(self):
+        self.calls['hide_lookup_table'] += 1
+        self.candidates = []
+
+    def get_surrounding_text(self):
+        text, cursor_pos, anchor_pos = self.surrounding_text
+        return Text(text), cursor_pos, anchor_pos
+
+    def commit_text(self, text):
+        self.calls['commit_text'] += 1
+        self.committed.append(text.get_text())
+
+# Number keys, which select completion candidates
+for _digit in range(10):
+    globals()[f"KEY_{_digit}"] = 0x0030 + _digit
+    globals()[f"KEY_KP_{_digit}"] = 0xffb0 + _digit
+
+def install():
+    """Make `import gi` and `from gi.repository import IBus` use this module"""
+    gi = types.ModuleType('gi')
+    gi.require_version = lambda namespace, version: None
+    repository = types.ModuleType('gi.repository')
+    repository.IBus = sys.modules[__name__]
+    gi.repository = repository
+
+    sys.modules['gi'] = gi
+    sys.modules['gi.repository'] = repository
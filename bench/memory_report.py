@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Report the memory footprint of the rule table and of a Composer.
+
+The "before" figures are measured by building the same table from plain
+rule and trie node classes that keep a per-instance __dict__ and do not
+intern their strings, the way rules used to be stored, and by counting
+the whole table against every composer, which is what each Composer used
+to own. Each layout is built in a process of its own, so that neither
+finds strings or objects that the other already allocated.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tracemalloc
+
+# Add the engine directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "engine"))
+
+LAYOUTS = ("dict", "slots")
+
+class DictConversionRule:
+    """A conversion rule with a per-instance __dict__ and its own strings"""
+    def __init__(self, from_str, to_str, flags):
+        self.from_str = from_str
+        self.to_str = to_str
+        self.flags = flags
+
+class DictRuleTrieNode:
+    """A rule trie node with a per-instance __dict__"""
+    def __init__(self, parent=None):
+        self.children = {}
+        self.parent = parent
+        self.rules = []
+
+def measure(func):
+    """
+    Measure the memory still allocated after calling a function
+
+    Args:
+        func: The function to call
+
+    Returns:
+        A tuple (result, allocated bytes)
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = func()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, after - before
+
+def child(layout):
+    """Build the rule table in a layout and print its size, the size of a
+    Composer and the number of rules"""
+    import composer
+
+    if layout == "dict":
+        composer.ConversionRule, composer.RuleTrieNode = DictConversionRule, DictRuleTrieNode
+    # Parse the rule file first, so that only the table is measured
+    rules = composer.parse_rule_file(composer.default_rule_file_path())
+    table, table_size = measure(lambda: composer.RuleTable(rules))
+
+    # A composer shares the table, so only its live composition is counted
+    _, composer_size = measure(lambda: composer.Composer(table))
+    print(table_size, composer_size, len(table.rules))
+
+def measure_layout(layout):
+    """Run child() for a layout in a new process and read what it prints"""
+    output = subprocess.run([sys.executable, __file__, "--child", layout],
+                            check=True, stdout=subprocess.PIPE, text=True).stdout
+    return tuple(int(field) for field in output.split())
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory footprint of the rule table")
+    parser.add_argument('--child', choices=LAYOUTS, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.child:
+        child(options.child)
+        return
+
+    dict_table_size, _, rule_count = measure_layout("dict")
+    table_size, composer_size, _ = measure_layout("slots")
+
+    print(f"Rules: {rule_count}")
+    print("-" * 50)
+    print(f"{'':<28} {'Before':>10} {'After':>10}")
+    print(f"{'Rule table (bytes)':<28} {dict_table_size:>10} {table_size:>10}")
+    print(f"{'Per Composer (bytes)':<28} {dict_table_size:>10} {composer_size:>10}")
+    for count in (10, 100):
+        before = dict_table_size * count
+        after = table_size + composer_size * count
+        print(f"{f'{count} composers (bytes)':<28} {before:>10} {after:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Replay a key sequence through BuuzEngine without IBus and report the
+per-key latency and the number of calls the engine would send to the IBus
+daemon over D-Bus.
+
+The key sequence is either recorded from a running engine, by taking the
+do_process_key_event lines from its --verbose log:
+
+    python3 bench/replay_keys.py --log ibus-buuz.log
+
+or made by "typing" a text file, with a press and a release per key:
+
+    python3 bench/replay_keys.py --text sample.txt
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+# Add the engine directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "engine"))
+
+import fake_ibus
+fake_ibus.install()
+
+from engine import BuuzEngine
+from stats import STATS
+
+DEFAULT_TEXT = "Sain baina uu? Bi buuz id'ye. Mongol hel surch baina.\n" * 20
+
+# Key events as printed by do_process_key_event in verbose mode
+_KEY_EVENT_RE = re.compile(r"do_process_key_event\(keyval=(\d+), keycode=(\d+), state=(\d+)\)")
+
+# Keyvals of characters that do not map to their code point
+_SPECIAL_KEYVALS = {
+    "\n": fake_ibus.KEY_Return,
+    " ": fake_ibus.KEY_space,
+}
+
+def read_log(path):
+    """
+    Read the key events recorded in a verbose log
+
+    Returns:
+        A list of (keyval, keycode, state) tuples
+    """
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return [tuple(int(v) for v in m.groups()) for m in _KEY_EVENT_RE.finditer(f.read())]
+
+def text_to_events(text):
+    """
+    Turn text into the key events of typing it: a press and a release per
+    character, with Shift held for upper case letters and '"'
+
+    Returns:
+        A list of (keyval, keycode, state) tuples
+    """
+    events = []
+    release = fake_ibus.ModifierType.RELEASE_MASK
+    for char in text:
+        keyval = _SPECIAL_KEYVALS.get(char, ord(char))
+        state = fake_ibus.ModifierType.SHIFT_MASK if char.isupper() or char == '"' else 0
+        events.append((keyval, 0, state))
+        events.append((keyval, 0, state | release))
+    return events
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def replay(events):
+    """
+    Feed key events to a new engine
+
+    Returns:
+        A tuple (engine, per-event latencies in microseconds, the text the
+        application would have received)
+    """
+    engine = BuuzEngine()
+    latencies = []
+    output = []
+    release = fake_ibus.ModifierType.RELEASE_MASK
+    keyval_chars = {keyval: char for char, keyval in _SPECIAL_KEYVALS.items()}
+    clock = time.perf_counter_ns
+    for keyval, keycode, state in events:
+        committed = len(engine.committed)
+        start = clock()
+        handled = engine.do_process_key_event(keyval, keycode, state)
+        latencies.append((clock() - start) / 1000)
+
+        output.extend(engine.committed[committed:])
+        if not handled and not state & release:
+            # IBus passes the key on to the application
+            if keyval in keyval_chars:
+                output.append(keyval_chars[keyval])
+            elif 0x20 <= keyval < 0x7f:
+                output.append(chr(keyval))
+
+    committed = len(engine.committed)
+    engine.do_focus_out()
+    output.extend(engine.committed[committed:])
+    return engine, latencies, "".join(output)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay key events through the engine without IBus")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--log', help="replay the key events of a --verbose log")
+    source.add_argument('--text', help="replay typing the text of this file")
+    parser.add_argument('--show-output', action='store_true', help="print the committed text")
+    options = parser.parse_args()
+
+    if options.log:
+        events = read_log(options.log)
+    elif options.text:
+        with open(options.text, encoding='utf-8') as f:
+            events = text_to_events(f.read())
+    else:
+        events = text_to_events(DEFAULT_TEXT)
+
+    if not events:
+        print("No key events to replay", file=sys.stderr)
+        sys.exit(1)
+
+    engine, latencies, output = replay(events)
+    latencies.sort()
+
+    print(f"Key events:         {len(events)}")
+    print(f"Latency p50:        {percentile(latencies, 0.50):.1f} us")
+    print(f"Latency p99:        {percentile(latencies, 0.99):.1f} us")
+    print(f"Latency max:        {latencies[-1]:.1f} us")
+    total_calls = sum(engine.calls.values())
+    print(f"D-Bus calls:        {total_calls} ({total_calls / len(events):.2f} per key event)")
+    for name, count in sorted(engine.calls.items()):
+        print(f"  {name:<22}{count}")
+    print(f"Skipped updates:    {STATS.preedit_updates_skipped} (preedit unchanged)")
+
+    if options.show_output:
+        print("-" * 50)
+        print(output, end="")
+
+if __name__ == "__main__":
+    main()
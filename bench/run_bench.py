@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmarks of the composer and engine hot paths.
+
+Runs without IBus: the engine is driven through the stand-in IBus module
+in fake_ibus.py. Results can be saved as JSON and compared with the
+results of an earlier run:
+
+    python3 bench/run_bench.py --output before.json
+    ... change something ...
+    python3 bench/run_bench.py --compare before.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+# Add the engine directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "engine"))
+
+import fake_ibus
+fake_ibus.install()
+
+from composer import Composer, RuleTable
+from engine import BuuzEngine
+
+SHORT_WORDS = ["buuz", "id'ye", "Mongol", "hel", "delgereh", "o'dor", "shine", "tsag"]
+PREEDIT = "Ulaanbaataryn'hothondoo'rshinjilgeenii'ajilhiijbaina"[:50]
+PARAGRAPH = " ".join(["Mongol hel", "buuz id'ye", "ene bol sain baina uu",
+                      "Ulaanbaatar hotod o'nodor ch boroo orno"] * 250)
+TABLE = ("| 2024 | 1234.56 |    789 | Mongol |\n" + "-" * 44 + "\n") * 200
+TYPING_SESSION = " ".join(["sain baina uu", "bi buuz id'ye", "Mongol hel surch baina"] * 10) + " "
+
+def bench_rule_table():
+    RuleTable()
+
+def bench_composer():
+    Composer()
+
+def make_convert_short(word_cache=None):
+    c = Composer(word_cache=word_cache)
+    def bench():
+        for word in SHORT_WORDS:
+            c.convert(word)
+    return bench, len(SHORT_WORDS)
+
+def make_convert_short_cached():
+    # The shared word cache, which every word hits after the first call
+    return make_convert_short(word_cache=False)
+
+def make_convert_preedit():
+    c = Composer(word_cache=None)
+    return lambda: c.convert(PREEDIT), 1
+
+def make_convert_paragraph():
+    c = Composer()
+    return lambda: c.convert(PARAGRAPH), 1
+
+def make_convert_table():
+    c = Composer()
+    return lambda: c.convert(TABLE), 1
+
+def make_typing_session():
+    engine = BuuzEngine()
+    keys = [fake_ibus.KEY_space if char == " " else ord(char) for char in TYPING_SESSION]
+    def bench():
+        for keyval in keys:
+            engine.do_process_key_event(keyval, 0, 0)
+    return bench, len(keys)
+
+# name: (factory returning (function, operations per call), description)
+BENCHMARKS = {
+    'rule_table_build': (lambda: (bench_rule_table, 1), "RuleTable() construction"),
+    'composer_init': (lambda: (bench_composer, 1), "Composer() with the shared table"),
+    'convert_short_word': (make_convert_short, "convert() per short word"),
+    'convert_short_word_cached': (make_convert_short_cached, "convert() per short word, from the word cache"),
+    'convert_preedit_50': (make_convert_preedit, "convert() of a 50-character preedit"),
+    'convert_paragraph': (make_convert_paragraph, f"convert() of {len(PARAGRAPH)} characters"),
+    'convert_table': (make_convert_table, f"convert() of a {len(TABLE)}-character table"),
+    'typing_per_key': (make_typing_session, "do_process_key_event() per key while typing"),
+}
+
+def run_benchmark(func, ops, min_time, rounds):
+    """
+    Time a benchmark function
+
+    Args:
+        func: The function to call
+        ops: The number of operations one call performs
+        min_time: Minimum duration of one round in seconds
+        rounds: The number of rounds
+
+    Returns:
+        A dict of per-operation timings in microseconds
+    """
+    # Find how many calls fill a round
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2
+
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        times.append((time.perf_counter() - start) / loops / ops * 1e6)
+
+    return {
+        'min_us': min(times),
+        'median_us': statistics.median(times),
+        'max_us': max(times),
+        'loops': loops,
+        'rounds': rounds,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the composer and engine")
+    parser.add_argument('-o', '--output', help="save the results to this JSON file")
+    parser.add_argument('-c', '--compare', help="compare with results saved in this JSON file")
+    parser.add_argument('-k', '--filter', default="", help="run only benchmarks whose name contains this")
+    parser.add_argument('--min-time', type=float, default=0.2, help="minimum seconds per round")
+    parser.add_argument('--rounds', type=int, default=5, help="number of rounds")
+    options = parser.parse_args()
+
+    baseline = {}
+    if options.compare:
+        with open(options.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    print(f"{'Benchmark':<26} {'Median (us)':>12} {'Min (us)':>10} {'Change':>8}  Description")
+    print("-" * 100)
+    for name, (factory, description) in BENCHMARKS.items():
+        if options.filter not in name:
+            continue
+        func, ops = factory()
+        result = run_benchmark(func, ops, options.min_time, options.rounds)
+        results[name] = result
+
+        change = ""
+        if name in baseline:
+            change = "{:+.1f}%".format((result['median_us'] / baseline[name]['median_us'] - 1) * 100)
+        print(f"{name:<26} {result['median_us']:>12.2f} {result['min_us']:>10.2f} {change:>8}  {description}")
+
+    if options.output:
+        data = {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results,
+        }
+        with open(options.output, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        print(f"Results saved to {options.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Per-process memory of the rule table, loaded into each process or mapped
+from a shared rule trie (--shared-rules).
+
+Starts several processes per mode, as if several users were typing on one
+host, and reads their memory use from /proc/<pid>/smaps_rollup once each
+has converted some text:
+
+    python3 bench/shared_memory.py --processes 8
+
+The "none" mode imports the composer without loading any rules; the
+"Rules" column is the private memory of a mode above that baseline, and
+the "Heap" column the Python heap allocated for loading the rules, as
+traced by tracemalloc. Private memory is counted in whole pages, so for a
+small rule table the heap figure is the more precise one. Linux only.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tracemalloc
+
+# Add the engine directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "engine"))
+
+MODES = ("none", "loaded", "mapped")
+
+TEXT = " ".join(["Mongol hel", "buuz id'ye", "ene bol sain baina uu",
+                 "Ulaanbaatar hotod o'nodor ch boroo orno"] * 50)
+
+def child(mode):
+    """Load the rules as `mode` says, convert some text, and wait"""
+    import composer
+
+    heap = 0
+    if mode != "none":
+        tracemalloc.start()
+        composer.set_mapped_rules(mode == "mapped")
+        composer.Composer().convert(TEXT)
+        heap = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+    print("ready", heap, flush=True)
+    sys.stdin.read()
+
+def read_smaps_rollup(pid):
+    """
+    Read the memory use of a process
+
+    Returns:
+        A dict of smaps_rollup fields in kB, such as 'Rss', 'Pss',
+        'Private_Dirty' and 'Shared_Clean'
+    """
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields
+
+def measure(mode, processes):
+    """
+    Start processes in a mode and read their memory use
+
+    Returns:
+        A dict of smaps_rollup fields in kB, and 'Heap', the Python heap
+        allocated for the rules in kB, averaged over the processes
+    """
+    children = [subprocess.Popen([sys.executable, __file__, "--child", mode],
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                for _ in range(processes)]
+    try:
+        heaps = {}
+        for proc in children:
+            reply = proc.stdout.readline().split()
+            if not reply or reply[0] != "ready":
+                raise RuntimeError(f"{mode} process {proc.pid} failed")
+            heaps[proc.pid] = int(reply[1]) / 1024
+        samples = [dict(read_smaps_rollup(proc.pid), Heap=heaps[proc.pid]) for proc in children]
+    finally:
+        for proc in children:
+            proc.stdin.close()
+            proc.wait()
+
+    return {key: sum(s.get(key, 0) for s in samples) / len(samples) for key in samples[0]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-process memory of the rule table")
+    parser.add_argument('-n', '--processes', type=int, default=4, help="processes per mode")
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.child:
+        child(options.child)
+        return
+
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        print("/proc/self/smaps_rollup is not available", file=sys.stderr)
+        sys.exit(1)
+
+    # Compile the rule trie and the transducer first, so the processes
+    # only map them
+    import composer
+    from fst import get_fst
+    from mapped_table import load_mapped_rule_table
+    get_fst(load_mapped_rule_table(composer.get_rule_file()))
+
+    results = {mode: measure(mode, options.processes) for mode in MODES}
+    private = {mode: r['Private_Clean'] + r['Private_Dirty'] for mode, r in results.items()}
+
+    print(f"Average of {options.processes} processes per mode, in kB")
+    print(f"{'Mode':<8} {'Rss':>8} {'Pss':>8} {'Shared':>8} {'Private':>8} {'Rules':>8} {'Heap':>8}")
+    print("-" * 62)
+    for mode, r in results.items():
+        shared = r['Shared_Clean'] + r['Shared_Dirty']
+        print(f"{mode:<8} {r['Rss']:>8.0f} {r['Pss']:>8.0f} {shared:>8.0f}"
+              f" {private[mode]:>8.0f} {private[mode] - private['none']:>8.0f} {r['Heap']:>8.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from composer import Composer
+from fst import get_fst
+from stats import STATS, PerfStats
+from utils import debug_print
+
+# Texts at least this long are converted in a worker thread; shorter ones
+# convert faster than a thread starts
+ASYNC_MIN_LENGTH = 4096
+
+# Number of characters a worker converts between checks for cancellation
+ASYNC_SLICE_SIZE = 16 * 1024
+
+class ConversionJob:
+    """
+    A conversion started by AsyncConverter.convert()
+    """
+    __slots__ = ('text', 'callback', 'cancelled', 'stats')
+
+    def __init__(self, text, callback):
+        self.text = text
+        self.callback = callback
+        # Set from the main loop; the worker stops at the next slice and the
+        # result is never delivered
+        self.cancelled = threading.Event()
+        # The conversion is counted here rather than in STATS, which only
+        # the main loop changes; see AsyncConverter._deliver()
+        self.stats = PerfStats()
+
+class AsyncConverter:
+    """
+    Converts texts without blocking the main loop, so that it keeps
+    handling key events. Large texts are converted in a worker thread. The
+    result is passed to the callback from the main loop, never from the
+    worker, and never before convert() returns.
+
+    Only one job runs at a time: starting a new one, or calling cancel(),
+    drops the one before.
+    """
+    def __init__(self, rule_table=None, idle_add=None):
+        """
+        Args:
+            rule_table: The rule table; the shared one if None
+            idle_add: The function that runs a callback in the main loop;
+                      GLib.idle_add if None
+        """
+        if idle_add is None:
+            from gi.repository import GLib
+            idle_add = GLib.idle_add
+        self._idle_add = idle_add
+        self._rule_table = rule_table
+        self._job = None
+
+    @property
+    def busy(self):
+        """Whether a job is running or waits to be delivered"""
+        return self._job is not None
+
+    def convert(self, text, callback):
+        """
+        Start converting a text, cancelling the running job if any. The
+        text is converted the way it would be typed, as --convert does.
+
+        Args:
+            text: The Latin text to convert
+            callback: Called from the main loop with the converted text,
+                      unless the job is cancelled first
+        """
+        self.cancel()
+        job = ConversionJob(text, callback)
+        self._job = job
+
+        # A composer of its own: the word cache is not shared with the main
+        # loop, which may use it at the same time. The transducer is loaded
+        # here, as compiling it converts with the rule table, which counts
+        # in STATS.
+        composer = Composer(self._rule_table, word_cache=None, stats=job.stats)
+        get_fst(composer.table)
+
+        if len(text) < ASYNC_MIN_LENGTH:
+            start = time.perf_counter()
+            converted = "".join(composer.convert_stream((text,)))
+            self._idle_add(self._deliver, job, converted, time.perf_counter() - start)
+            return
+
+        thread = threading.Thread(target=self._run, args=(job, composer),
+                                  name="buuz-convert", daemon=True)
+        thread.start()
+
+    def cancel(self):
+        """Drop the running job; its callback is not called"""
+        job = self._job
+        if job is not None:
+            job.cancelled.set()
+            self._job = None
+            STATS.async_cancelled += 1
+            debug_print("Cancelled conversion of %d characters", len(job.text))
+
+    def _run(self, job, composer):
+        """Convert the text of a job in the worker thread"""
+        start = time.perf_counter()
+        text = job.text
+
+        def slices():
+            for i in range(0, len(text), ASYNC_SLICE_SIZE):
+                if job.cancelled.is_set():
+                    return
+                yield text[i:i + ASYNC_SLICE_SIZE]
+
+        converted = "".join(composer.convert_stream(slices()))
+        if not job.cancelled.is_set():
+            self._idle_add(self._deliver, job, converted, time.perf_counter() - start)
+
+    def _deliver(self, job, converted, elapsed):
+        """Pass the result of a job to its callback, in the main loop"""
+        # The job may have been cancelled after the worker finished
+        if job is self._job and not job.cancelled.is_set():
+            self._job = None
+            STATS.async_conversions += 1
+            STATS.async_convert_time += elapsed
+            STATS.convert_calls += job.stats.convert_calls
+            STATS.chars_converted += job.stats.chars_converted
+            STATS.convert_time += job.stats.convert_time
+            job.callback(converted)
+        return False
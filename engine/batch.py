@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import multiprocessing
+import sys
+import time
+
+import composer
+from composer import Composer
+from utils import debug_print
+
+# Number of characters read at a time when converting files
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Composer of a worker process, created by the first piece it converts
+_worker_composer = None
+
+class ConversionStats:
+    """
+    Throughput of a file conversion
+    """
+    def __init__(self, input_bytes, seconds):
+        self.input_bytes = input_bytes
+        self.seconds = seconds
+
+    @property
+    def mb_per_second(self):
+        if self.seconds <= 0:
+            return 0.0
+        return self.input_bytes / self.seconds / (1024 * 1024)
+
+    def __str__(self):
+        return "Converted {:.2f} MB in {:.2f} s ({:.2f} MB/s)".format(
+            self.input_bytes / (1024 * 1024), self.seconds, self.mb_per_second)
+
+def open_text(path, mode):
+    """
+    Open a text file for conversion, or standard input/output for "-"
+
+    Args:
+        path: The file path or "-"
+        mode: 'r' or 'w'
+
+    Returns:
+        The opened file object
+    """
+    if path == "-":
+        stream = sys.stdin if mode == 'r' else sys.stdout
+        return open(stream.fileno(), mode, encoding='utf-8', newline='', closefd=False)
+    return open(path, mode, encoding='utf-8', newline='')
+
+def split_at_words(fin, chunk_size):
+    """
+    Read a text file in pieces of about chunk_size characters that do not
+    split words. Conversion starts every word over, so the pieces convert
+    independently of each other. Only a run of input characters of at
+    least chunk_size, which no real text has, is split, so that memory
+    stays bounded; it may then convert differently at the split.
+
+    Args:
+        fin: The file to read
+        chunk_size: The number of characters to read at a time
+
+    Yields:
+        The pieces of the text, in order
+    """
+    word_re = composer._WORD_RE
+    carry = ""
+    while True:
+        block = fin.read(chunk_size)
+        if not block:
+            if carry:
+                yield carry
+            return
+
+        block = carry + block
+
+        # Cut after the last character that ends a word
+        cut = len(block)
+        while cut > 0 and word_re.match(block, cut - 1):
+            cut -= 1
+        if len(block) - cut >= chunk_size:
+            # No word ended in a whole chunk
+            cut = len(block)
+        elif cut == 0:
+            # A single word so far; keep reading until it ends
+            carry = block
+            continue
+
+        carry = block[cut:]
+        yield block[:cut]
+
+def _init_worker(rule_file, mapped_rules, word_cache_size):
+    """Make a worker process use the rules and settings of the parent process"""
+    composer.set_rule_file(rule_file)
+    composer.set_mapped_rules(mapped_rules)
+    composer.set_word_cache_size(word_cache_size)
+
+def _convert_piece(piece):
+    """Convert a piece of text in a worker process"""
+    global _worker_composer
+    if _worker_composer is None:
+        _worker_composer = Composer()
+    return "".join(_worker_composer.convert_stream((piece,)))
+
+def convert_file(in_path, out_path, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Convert a Latin text file to Mongolian Cyrillic. The file is read and
+    written in chunks, so files of any size convert in bounded memory.
+
+    With more than one worker, the text is split at word boundaries and the
+    pieces are converted in a pool of processes. The output is the same as
+    when converting with a single worker, unless a run of input characters
+    is at least chunk_size long, see split_at_words().
+
+    Args:
+        in_path: The input file path, or "-" for standard input
+        out_path: The output file path, or "-" for standard output
+        workers: The number of worker processes
+        chunk_size: The number of characters read at a time
+
+    Returns:
+        The ConversionStats of the conversion
+    """
+    start = time.perf_counter()
+    input_bytes = 0
+
+    with open_text(in_path, 'r') as fin, open_text(out_path, 'w') as fout:
+        if workers <= 1:
+            def read_chunks():
+                nonlocal input_bytes
+                for chunk in iter(lambda: fin.read(chunk_size), ""):
+                    input_bytes += len(chunk.encode('utf-8'))
+                    yield chunk
+
+            for converted in Composer().convert_stream(read_chunks()):
+                fout.write(converted)
+        else:
+            debug_print("Converting with %d workers, %d characters per chunk", workers, chunk_size)
+            # Workers use the same rules, whatever the start method
+            word_cache = composer.get_word_cache()
+            settings = (composer.get_rule_file(), composer.get_mapped_rules(),
+                        word_cache.max_size if word_cache is not None else 0)
+            with multiprocessing.Pool(workers, _init_worker, settings) as pool:
+                # Keep only a few pieces in flight to bound memory use
+                pending = collections.deque()
+                for piece in split_at_words(fin, chunk_size):
+                    input_bytes += len(piece.encode('utf-8'))
+                    pending.append(pool.apply_async(_convert_piece, (piece,)))
+                    if len(pending) >= workers * 2:
+                        fout.write(pending.popleft().get())
+                while pending:
+                    fout.write(pending.popleft().get())
+
+    return ConversionStats(input_bytes, time.perf_counter() - start)
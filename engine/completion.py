@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import array
+import heapq
+import mmap
+import os
+import struct
+import time
+
+from composer import file_digest
+from stats import STATS
+import utils
+from utils import debug_print
+
+# File name of the word list, in the configuration directories searched by
+# find_word_list()
+WORD_LIST_NAME = "words.txt"
+
+# Number of candidates kept per hot prefix, which bounds the number of
+# candidates a lookup can return
+MAX_CANDIDATES = 9
+
+# Prefixes of more words than this are hot: their best candidates are
+# stored in the index, since scanning their words would take too long
+MAX_SCAN_WORDS = 2048
+
+# Word index format: a header (magic, version, digest of the word list, a
+# byte order mark, the number of words and of hot prefixes, the number of
+# candidates per hot prefix, the size of the string data), then arrays of
+# unsigned 32-bit integers in native byte order:
+#
+#   word_offsets[words + 1]   UTF-8 of each word in the string data, with
+#                             the words sorted by their UTF-8
+#   word_counts[words]        frequency of each word
+#   hot_offsets[hot + 1]      UTF-8 of each hot prefix in the string data,
+#                             with the prefixes sorted the same way
+#   hot_words[hot * k]        best words of each hot prefix, most frequent
+#                             first, padded with NO_WORD
+#
+# and the string data. Sorting by UTF-8 sorts by code point, so the words
+# that start with a prefix are a contiguous range that binary search finds
+# by comparing bytes, without decoding any word.
+WORD_INDEX_MAGIC = b"BUUZWORD"
+WORD_INDEX_VERSION = 1
+_BYTE_ORDER_MARK = 0x01020304
+_INDEX_HEADER = struct.Struct("=8sI32s5I")
+NO_WORD = 0xffffffff
+
+# The arrays hold 32-bit integers
+assert array.array('I').itemsize == 4
+
+class PrefixRange:
+    """
+    The words of a word index that start with a prefix, see
+    WordIndex.find_prefix()
+    """
+    __slots__ = ('prefix', 'start', 'end')
+
+    def __init__(self, prefix, start, end):
+        self.prefix = prefix
+        self.start = start
+        self.end = end
+
+class WordIndex:
+    """
+    A read-only word frequency list used in place from a memory-mapped word
+    index, for completion candidates
+
+    Lookups decode only the words they return, so the list costs the
+    process no memory beyond the pages of the mapping it touches.
+    """
+    def __init__(self, path, digest):
+        """
+        Args:
+            path: The word index file path
+            digest: SHA-256 digest of the word list the index must be built from
+
+        Raises:
+            OSError: If the file cannot be mapped
+            ValueError: If the file is not a word index of this word list
+        """
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, index_digest, byte_order, words, hot, k, string_size = \
+            _INDEX_HEADER.unpack_from(self._map, 0)
+        if magic != WORD_INDEX_MAGIC or version != WORD_INDEX_VERSION or byte_order != _BYTE_ORDER_MARK:
+            raise ValueError(f"{path} is not a word index of this version")
+        if index_digest != digest:
+            raise ValueError(f"{path} was built from a different word list")
+
+        view = memoryview(self._map)
+        offset = _INDEX_HEADER.size
+        def take(count):
+            nonlocal offset
+            end = offset + count * 4
+            if end > len(view):
+                raise ValueError(f"{path} is truncated")
+            ints = view[offset:end].cast('I')
+            offset = end
+            return ints
+
+        self._word_offsets = take(words + 1)
+        self._word_counts = take(words)
+        self._hot_offsets = take(hot + 1)
+        self._hot_words = take(hot * k)
+        if offset + string_size != len(view):
+            raise ValueError(f"{path} is truncated")
+        self._strings_start = offset
+        self.word_count = words
+        self._hot_count = hot
+        self._k = k
+
+    def _word_bytes(self, i):
+        start = self._strings_start
+        return self._map[start + self._word_offsets[i]:start + self._word_offsets[i + 1]]
+
+    def word(self, i):
+        """Get the word at position i of the sorted list"""
+        return str(self._word_bytes(i), 'utf-8')
+
+    def find_prefix(self, prefix, within=None):
+        """
+        Find the words that start with a prefix
+
+        Args:
+            prefix: The prefix
+            within: The PrefixRange of a prefix of this prefix, such as the
+                    one found for the previous key press, to search in
+                    instead of the whole list
+
+        Returns:
+            The PrefixRange of the prefix
+        """
+        if within is not None:
+            lo, hi = within.start, within.end
+        else:
+            lo, hi = 0, self.word_count
+        key = prefix.encode('utf-8')
+        key_length = len(key)
+        word_bytes = self._word_bytes
+
+        # First word not before the prefix
+        start, end = lo, hi
+        while start < end:
+            mid = (start + end) // 2
+            if word_bytes(mid) < key:
+                start = mid + 1
+            else:
+                end = mid
+        first = start
+
+        # First word after all words that start with the prefix
+        end = hi
+        while start < end:
+            mid = (start + end) // 2
+            if word_bytes(mid)[:key_length] <= key:
+                start = mid + 1
+            else:
+                end = mid
+        return PrefixRange(prefix, first, start)
+
+    def _hot_prefix(self, key):
+        """Find a hot prefix by its UTF-8; returns its position or -1"""
+        start = self._strings_start
+        offsets = self._hot_offsets
+        lo, hi = 0, self._hot_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._map[start + offsets[mid]:start + offsets[mid + 1]] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._hot_count and self._map[start + offsets[lo]:start + offsets[lo + 1]] == key:
+            return lo
+        return -1
+
+    def candidates(self, prefix_range, count=MAX_CANDIDATES):
+        """
+        Get the most frequent words of a prefix, other than the prefix itself
+
+        Args:
+            prefix_range: The PrefixRange from find_prefix()
+            count: The number of candidates wanted, at most MAX_CANDIDATES
+
+        Returns:
+            A list of up to count words, most frequent first
+        """
+        start_time = time.perf_counter()
+        size = prefix_range.end - prefix_range.start
+        if size > MAX_SCAN_WORDS:
+            # The compiler stored the best words of every prefix this common
+            h = self._hot_prefix(prefix_range.prefix.encode('utf-8'))
+            if h < 0:
+                # Only the empty prefix is not stored
+                best = []
+            else:
+                best = [i for i in self._hot_words[h * self._k:(h + 1) * self._k] if i != NO_WORD]
+        else:
+            counts = self._word_counts
+            best = heapq.nlargest(count + 1, range(prefix_range.start, prefix_range.end),
+                                  key=counts.__getitem__)
+
+        words = [word for word in map(self.word, best) if word != prefix_range.prefix][:count]
+        STATS.completion_lookups += 1
+        STATS.completion_time += time.perf_counter() - start_time
+        return words
+
+def parse_word_list(path):
+    """
+    Read a word frequency list: one word per line, optionally followed by
+    whitespace and its count. Words without a count rank by their line, the
+    first one highest. Empty lines and lines starting with '#' are skipped.
+
+    Args:
+        path: The word list path
+
+    Returns:
+        A dict that maps each word to its count
+
+    Raises:
+        OSError: If the file cannot be read
+        ValueError: If a count is not a number
+    """
+    counts = {}
+    with open(path, encoding='utf-8') as f:
+        lines = [line.split() for line in f if line.strip() and not line.startswith("#")]
+    for rank, fields in enumerate(lines):
+        if len(fields) > 1:
+            try:
+                count = int(fields[1])
+            except ValueError:
+                raise ValueError(f"{path}: invalid count {fields[1]!r} for {fields[0]!r}")
+        else:
+            count = len(lines) - rank
+        counts[fields[0]] = counts.get(fields[0], 0) + count
+    return counts
+
+def save_word_index(counts, path, digest, k=MAX_CANDIDATES):
+    """
+    Write a word index file
+
+    Args:
+        counts: A dict that maps each word to its count
+        path: The word index file path
+        digest: SHA-256 digest of the word list the counts were read from
+        k: The number of candidates kept per hot prefix
+    """
+    entries = sorted((word.encode('utf-8'), min(count, NO_WORD - 1)) for word, count in counts.items())
+
+    blob = bytearray()
+    word_offsets = array.array('I')
+    word_counts = array.array('I')
+    for data, count in entries:
+        word_offsets.append(len(blob))
+        word_counts.append(count)
+        blob.extend(data)
+    word_offsets.append(len(blob))
+
+    # Count the words of each prefix, ending on a character boundary, and
+    # keep the best words of those with too many to scan
+    prefix_words = {}
+    for i, (data, count) in enumerate(entries):
+        word = data.decode('utf-8')
+        for length in range(1, len(word) + 1):
+            prefix_words.setdefault(word[:length].encode('utf-8'), []).append(i)
+    hot = sorted(key for key, words in prefix_words.items() if len(words) > MAX_SCAN_WORDS)
+
+    hot_offsets = array.array('I')
+    hot_words = array.array('I')
+    for key in hot:
+        hot_offsets.append(len(blob))
+        blob.extend(key)
+        best = heapq.nlargest(k + 1, prefix_words[key], key=lambda i: entries[i][1])
+        # One more than k, in case the prefix itself is a word
+        best = [i for i in best if entries[i][0] != key][:k]
+        hot_words.extend(best + [NO_WORD] * (k - len(best)))
+    hot_offsets.append(len(blob))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_INDEX_HEADER.pack(WORD_INDEX_MAGIC, WORD_INDEX_VERSION, digest, _BYTE_ORDER_MARK,
+                                   len(entries), len(hot), k, len(blob)))
+        for ints in (word_offsets, word_counts, hot_offsets, hot_words):
+            ints.tofile(f)
+        f.write(blob)
+    os.replace(tmp_path, path)
+
+def find_word_list():
+    """
+    Find the word list to use: the user's or the system administrator's,
+    in this order
+
+    Returns:
+        The path of the first word list that exists, or None
+    """
+    config_home = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    for path in (os.path.join(config_home, "ibus-buuz", WORD_LIST_NAME),
+                 os.path.join("/etc", "ibus-buuz", WORD_LIST_NAME)):
+        if os.path.isfile(path):
+            return path
+    return None
+
+def load_word_index(word_list):
+    """
+    Map the word index of a word list, compiling it into the cache
+    directory if it is missing or stale
+
+    Args:
+        word_list: The word list path
+
+    Returns:
+        The WordIndex
+
+    Raises:
+        OSError: If the word list cannot be read or the index cannot be written
+        ValueError: If the word list is not valid
+    """
+    digest = file_digest(word_list)
+    index_path = os.path.join(utils.get_cache_dir(), f"words-{digest.hex()[:16]}.idx")
+    try:
+        return WordIndex(index_path, digest)
+    except (OSError, ValueError):
+        pass
+
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    save_word_index(parse_word_list(word_list), index_path, digest)
+    debug_print("Compiled word list %s in %.1f ms", word_list, (time.perf_counter() - start) * 1e3)
+    return WordIndex(index_path, digest)
+
+# The word list set with set_word_list(), or None to look for one
+_word_list = None
+
+# Whether completion candidates are shown at all
+_completion_enabled = False
+
+# The word index shared by all engines, or False if not loaded yet
+_shared_word_index = False
+
+def set_completion(enabled, word_list=None):
+    """
+    Set whether completion candidates are shown, and from which word list
+
+    Args:
+        enabled: Whether to show completion candidates
+        word_list: The word list path, or None for the one found by
+                   find_word_list()
+    """
+    global _completion_enabled, _word_list, _shared_word_index
+    _completion_enabled = enabled
+    _word_list = word_list
+    _shared_word_index = False
+
+def get_word_index():
+    """
+    Get the word index shared by all engines of this process
+
+    Returns:
+        The WordIndex, or None if completion is disabled or there is no
+        usable word list
+    """
+    global _shared_word_index
+    if _shared_word_index is False:
+        _shared_word_index = None
+        word_list = _word_list or find_word_list()
+        if _completion_enabled and word_list:
+            try:
+                _shared_word_index = load_word_index(word_list)
+            except (OSError, ValueError) as e:
+                utils.logger.warning("Cannot load word list %s, completion is disabled: %s", word_list, e)
+    return _shared_word_index
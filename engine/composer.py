@@ -14,6 +14,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import ast
+import collections
+import hashlib
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+
+from stats import STATS
+import utils
 from utils import debug_print
 
 # Conversion rule flags
@@ -23,121 +35,110 @@ X_F  = 0x0004  # only for female words
 X_MM = 0x0008  # make the word male
 X_MF = 0x0010  # make the word female
 
+# Rule flags by the names used in rule files
+FLAG_NAMES = (("X_AC", X_AC), ("X_M", X_M), ("X_F", X_F), ("X_MM", X_MM), ("X_MF", X_MF))
+
+# File names of the rule file shipped with the engine and of the rule cache
+# compiled from it at install time, both next to this module
+RULE_FILE_NAME = "rules.txt"
+RULE_CACHE_NAME = "rules.cache"
+
+# Rule cache format: a header (magic, version, digest of the rule file,
+# number of rules, size of the string data), a record per rule (offset and
+# length of from_str and to_str in the string data, flags), and the string
+# data as UTF-8
+RULE_CACHE_MAGIC = b"BUUZRULE"
+RULE_CACHE_VERSION = 2
+_CACHE_HEADER = struct.Struct("<8sI32sII")
+_CACHE_RULE = struct.Struct("<IHIHH")
+
+# A rule line: two quoted strings and the flags
+_RULE_LINE_RE = re.compile(r"""\s*('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")\s+('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")\s+(\S.*?)\s*$""")
+
+# Default number of words in the word cache, and the longest word cached.
+# Together they cap the memory of the cache at a few megabytes.
+DEFAULT_WORD_CACHE_SIZE = 4096
+MAX_CACHED_WORD_LENGTH = 64
+
+# A run of input characters: the ASCII letters and quotes that words are
+# typed with. Any other character ends a word.
+_WORD_RE = re.compile(r"[A-Za-z'\"]+")
+
 class ConversionRule:
     """
     Represents a conversion rule for transliteration
     """
+    # Case expansion creates hundreds of rules that live as long as the
+    # daemon, so they are kept without a per-instance __dict__
+    __slots__ = ('from_str', 'to_str', 'flags')
+
     def __init__(self, from_str, to_str, flags):
-        self.from_str = from_str
-        self.to_str = to_str
+        self.from_str = sys.intern(from_str)
+        self.to_str = sys.intern(to_str)
         self.flags = flags
 
-class Composer:
+class RuleTrieNode:
     """
-    Handles transliteration from Latin to Mongolian Cyrillic
+    A node of the prefix trie built over the `from_str` of all conversion rules
     """
-    def __init__(self):
+    __slots__ = ('children', 'rules', 'parent')
+
+    def __init__(self, parent=None):
+        self.children = {}
+        self.parent = parent
+        # Rules whose from_str ends at this node, in the order they were added
+        self.rules = []
+
+class RuleTable:
+    """
+    The compiled conversion rules. A rule table is never modified after it is
+    built, so one table is shared by every Composer of the process.
+    """
+    def __init__(self, rules=None, expanded_rules=None):
+        """
+        Args:
+            rules: (from_str, to_str, flags) tuples of the rules, as read by
+                   parse_rule_file(); the rules of the rule file shipped with
+                   the engine if None
+            expanded_rules: (from_str, to_str, flags) tuples of rules that are
+                            already expanded, as stored in a rule cache; used
+                            instead of rules if given
+        """
+        start = time.perf_counter()
         self.rules = []
         self.rule_lengths = []
+        self.trie = RuleTrieNode()
 
         # Initialize conversion rules
-        self._init_rules()
-
-        # Compute and store rule lengths in descending order to ensure longer matches
-        # are attempted first during conversion (e.g. 'SH' should match before 'S')
+        if expanded_rules is not None:
+            self.rules = [ConversionRule(*rule) for rule in expanded_rules]
+        else:
+            if rules is None:
+                rules = parse_rule_file(default_rule_file_path())
+            for from_str, to_str, flags in rules:
+                self._add_rule(from_str, to_str, flags)
+        self.rules = tuple(self.rules)
+
+        # Compute and store rule lengths in descending order; the first one bounds
+        # how far ahead a single match can look
         self._compute_rule_lengths()
+        self.max_length = self.rule_lengths[0] if self.rule_lengths else 1
+
+        # SHA-256 digest of the rule file these rules were read from, which
+        # keys the saved transducer; None if they were not read from one
+        self.digest = None
+
+        # The transducer compiled from these rules, see fst.get_fst()
+        self.fst = None
 
-    def _init_rules(self):
-        """Initialize the conversion rules"""
-        # Add rules from the Windows IME
-        self._add_rule("А"   , "А" , X_M | X_F | X_MM | X_AC)
-        self._add_rule("АI"  , "АЙ", X_M | X_F | X_MM | X_AC)
-        self._add_rule("О"   , "О" , X_M | X_F | X_MM | X_AC)
-        self._add_rule("ОI"  , "ОЙ", X_M | X_F | X_MM | X_AC)
-        self._add_rule("У"   , "У" , X_M | X_F | X_MM | X_AC)
-        self._add_rule("УI"  , "УЙ", X_M | X_F | X_MM | X_AC)
-        self._add_rule("Э"   , "Э" , X_M | X_F | X_MF | X_AC)
-        self._add_rule("ЭI"  , "ЭЙ", X_M | X_F | X_MF | X_AC)
-        self._add_rule("Ө"   , "Ө" , X_M | X_F | X_MF | X_AC)
-        self._add_rule("ӨI"  , "ӨЙ", X_M | X_F | X_MF | X_AC)
-        self._add_rule("Ү"   , "Ү" , X_M | X_F | X_MF | X_AC)
-        self._add_rule("ҮI"  , "ҮЙ", X_M | X_F | X_MF | X_AC)
-
-        self._add_rule("ИI"  , "ИЙ", X_M | X_F |    0 | X_AC)
-
-        self._add_rule("A"   , "А" , X_M | X_F | X_MM | X_AC)
-        self._add_rule("AI"  , "АЙ", X_M | X_F | X_MM | X_AC)
-        self._add_rule("B"   , "Б" , X_M | X_F |    0 | X_AC)
-        self._add_rule("C"   , "Ц" , X_M | X_F |    0 | X_AC)
-        self._add_rule("CH"  , "Ч" , X_M | X_F |    0 | X_AC)
-        self._add_rule("D"   , "Д" , X_M | X_F |    0 | X_AC)
-        self._add_rule("E"   , "Э" , X_M | X_F | X_MF | X_AC)
-        self._add_rule("EI"  , "ЭЙ", X_M | X_F | X_MF | X_AC)
-        self._add_rule("F"   , "Ф" , X_M | X_F |    0 | X_AC)
-        self._add_rule("G"   , "Г" , X_M | X_F |    0 | X_AC)
-        self._add_rule("H"   , "Х" , X_M | X_F |    0 | X_AC)
-        self._add_rule("I"   , "И" , X_M | X_F |    0 | X_AC)
-        self._add_rule("II"  , "ИЙ", X_M | X_F |    0 | X_AC)
-        self._add_rule("III" , "Ы" , X_M | X_F |    0 | X_AC)
-        self._add_rule("J"   , "Ж" , X_M | X_F |    0 | X_AC)
-        self._add_rule("K"   , "К" , X_M | X_F |    0 | X_AC)
-        self._add_rule("KH"  , "Х" , X_M | X_F |    0 | X_AC)
-        self._add_rule("L"   , "Л" , X_M | X_F |    0 | X_AC)
-        self._add_rule("M"   , "М" , X_M | X_F |    0 | X_AC)
-        self._add_rule("N"   , "Н" , X_M | X_F |    0 | X_AC)
-
-        self._add_rule("O"   , "О" , X_M |   0 |    0 | X_AC)
-        self._add_rule("OI"  , "ОЙ", X_M |   0 |    0 | X_AC)
-        self._add_rule("O\"" , "О" , X_M | X_F | X_MM | X_AC)
-        self._add_rule("O\"I", "ОЙ", X_M | X_F | X_MM | X_AC)
-        self._add_rule("\"O" , "О" , X_M | X_F | X_MM | X_AC)
-        self._add_rule("\"OI", "ОЙ", X_M | X_F | X_MM | X_AC)
-
-        self._add_rule("O"   , "Ө" ,   0 | X_F |    0 | X_AC)
-        self._add_rule("OI"  , "ӨЙ",   0 | X_F |    0 | X_AC)
-        self._add_rule("Q"   , "Ө" , X_M | X_F | X_MF | X_AC)
-        self._add_rule("QI"  , "ӨЙ", X_M | X_F | X_MF | X_AC)
-        self._add_rule("O'"  , "Ө" , X_M | X_F | X_MF | X_AC)
-        self._add_rule("O'I" , "ӨЙ", X_M | X_F | X_MF | X_AC)
-        self._add_rule("'O"  , "Ө" , X_M | X_F | X_MF | X_AC)
-        self._add_rule("'OI" , "ӨЙ", X_M | X_F | X_MF | X_AC)
-
-        self._add_rule("P"   , "П" , X_M | X_F |    0 | X_AC)
-        self._add_rule("R"   , "Р" , X_M | X_F |    0 | X_AC)
-        self._add_rule("S"   , "С" , X_M | X_F |    0 | X_AC)
-        self._add_rule("SH"  , "Ш" , X_M | X_F |    0 | X_AC)
-        self._add_rule("SXC" , "Щ" , X_M | X_F |    0 | X_AC)
-        self._add_rule("T"   , "Т" , X_M | X_F |    0 | X_AC)
-
-        self._add_rule("U"   , "У" , X_M |   0 |    0 | X_AC)
-        self._add_rule("UI"  , "УЙ", X_M |   0 |    0 | X_AC)
-        self._add_rule("U\"" , "У" , X_M | X_F | X_MM | X_AC)
-        self._add_rule("U\"I", "УЙ", X_M | X_F | X_MM | X_AC)
-        self._add_rule("\"U" , "У" , X_M | X_F | X_MM | X_AC)
-        self._add_rule("\"UI", "УЙ", X_M | X_F | X_MM | X_AC)
-
-        self._add_rule("U"   , "Ү" ,   0 | X_F |    0 | X_AC)
-        self._add_rule("UI"  , "ҮЙ",   0 | X_F |    0 | X_AC)
-        self._add_rule("W"   , "Ү" , X_M | X_F | X_MF | X_AC)
-        self._add_rule("WI"  , "ҮЙ", X_M | X_F | X_MF | X_AC)
-        self._add_rule("U'"  , "Ү" , X_M | X_F | X_MF | X_AC)
-        self._add_rule("U'I" , "ҮЙ", X_M | X_F | X_MF | X_AC)
-        self._add_rule("'U"  , "Ү" , X_M | X_F | X_MF | X_AC)
-        self._add_rule("'UI" , "ҮЙ", X_M | X_F | X_MF | X_AC)
-
-        self._add_rule("V"   , "В" , X_M | X_F |    0 | X_AC)
-        self._add_rule("X"   , "Х" , X_M | X_F |    0 | X_AC)
-        self._add_rule("Y"   , "Ы" , X_M | X_F |    0 | X_AC)
-        self._add_rule("YA"  , "Я" , X_M | X_F | X_MM | X_AC)
-        self._add_rule("YE"  , "Е" , X_M | X_F | X_MF | X_AC)
-        self._add_rule("YO"  , "Ё" , X_M | X_F | X_MM | X_AC)
-        self._add_rule("YU"  , "Ю" , X_M | X_F | X_MM | X_AC)
-        self._add_rule("Z"   , "З" , X_M | X_F |    0 | X_AC)
-
-        self._add_rule("\""  , "ъ" , X_M | X_F |    0 |    0)
-        self._add_rule("\"\"", "Ъ" , X_M | X_F |    0 |    0)
-        self._add_rule("'"   , "ь" , X_M | X_F |    0 |    0)
-        self._add_rule("''"  , "Ь" , X_M | X_F |    0 |    0)
+        # The inverse of these rules, see reverse.get_reverse_index()
+        self.reverse_index = None
+
+        # Compile the rules into a prefix trie so that conversion can find the
+        # longest match at each position with a single walk
+        self._build_trie()
+
+        STATS.rule_table_build_time += time.perf_counter() - start
 
     def _add_rule(self, from_str, to_str, flags):
         """
@@ -200,6 +201,27 @@ class Composer:
             lengths.add(len(rule.from_str))
         self.rule_lengths = sorted(lengths, reverse=True)
 
+    def _build_trie(self):
+        """
+        Builds the prefix trie of rules. Rules sharing a `from_str` are kept in
+        the order they were added, so the first one that fits the word wins.
+        """
+        for rule in self.rules:
+            node = self.trie
+            for char in rule.from_str:
+                child = node.children.get(char)
+                if child is None:
+                    child = node.children[char] = RuleTrieNode(node)
+                node = child
+            node.rules.append(rule)
+
+        # Nothing changes the trie after it is built
+        stack = [self.trie]
+        while stack:
+            node = stack.pop()
+            node.rules = tuple(node.rules)
+            stack.extend(node.children.values())
+
     def dump_rules(self, filename):
         """
         Dump the current conversion rules to a file for debugging purposes
@@ -218,12 +240,7 @@ class Composer:
 
                 # Write rules
                 for rule in self.rules:
-                    flags_str = []
-                    if rule.flags & X_AC: flags_str.append("X_AC")
-                    if rule.flags & X_M: flags_str.append("X_M")
-                    if rule.flags & X_F: flags_str.append("X_F")
-                    if rule.flags & X_MM: flags_str.append("X_MM")
-                    if rule.flags & X_MF: flags_str.append("X_MF")
+                    flags_str = [name for name, flag in FLAG_NAMES if rule.flags & flag]
 
                     f.write("{:<20} {:<10} {:<10}\n".format(
                         repr(rule.from_str),
@@ -231,40 +248,463 @@ class Composer:
                         " | ".join(flags_str) or "0"
                     ))
 
-                debug_print(f"Rules successfully dumped to {filename}")
+                debug_print("Rules successfully dumped to %s", filename)
         except Exception as e:
-            debug_print(f"Error dumping rules to {filename}: {e}")
+            debug_print("Error dumping rules to %s: %s", filename, e)
 
-    def should_process_key(self, keyval):
+    def convert_into(self, text, i, stop, word_flags, out, checkpoints=None):
         """
-        Check if a key should be processed by the IME
+        Convert input, appending one piece of output per conversion step. This
+        is the conversion loop shared by all conversion paths; it matches
+        rules by walking the trie over the input in place, without slicing it.
 
         Args:
-            keyval: The key value
+            text: The Latin text being converted
+            i: The position to start at
+            stop: Conversion steps are taken only at positions before this
+            word_flags: The flags of the word so far (X_M or X_F)
+            out: The list the output pieces are appended to
+            checkpoints: If given, a (input offset, output offset, word_flags)
+                         tuple is appended to it after each step, where the
+                         output offset counts pieces in out
 
         Returns:
-            True if the key should be processed, False otherwise
+            A tuple (position, word_flags) where conversion stopped
         """
-        # Convert keyval to character
-        try:
-            char = chr(keyval)
-        except ValueError:
-            return False
+        start_time = time.perf_counter()
+        start = i
+        root = self.trie
+        n = len(text)
+        while i < stop:
+            # Walk the trie as far as the input allows
+            node = root
+            j = i
+            while j < n:
+                child = node.children.get(text[j])
+                if child is None:
+                    break
+                node = child
+                j += 1
+
+            # Back off from the longest match (e.g. 'SH' before 'S') to the
+            # first rule that fits the word
+            rule = None
+            while node is not root:
+                for candidate in node.rules:
+                    if (word_flags & candidate.flags) == word_flags:
+                        rule = candidate
+                        break
+                if rule is not None:
+                    break
+                node = node.parent
+                j -= 1
+
+            if rule is not None:
+                # Apply the rule
+                out.append(rule.to_str)
+
+                # Update word flags
+                if rule.flags & X_MF:
+                    word_flags = X_F
+                elif rule.flags & X_MM:
+                    word_flags = X_M
+                i = j
+            else:
+                # If no rule matched, copy the character as is
+                out.append(text[i])
+                i += 1
+
+            if checkpoints is not None:
+                checkpoints.append((i, len(out), word_flags))
 
-        # Check if it's an input character
-        return self._is_input_char(char)
+        STATS.convert_calls += 1
+        STATS.chars_converted += i - start
+        STATS.convert_time += time.perf_counter() - start_time
+        return i, word_flags
 
-    def _is_input_char(self, char):
+    def save_cache(self, path, digest):
         """
-        Check if a character is an input character
+        Save the expanded rules to a binary cache file that read_rule_cache()
+        can read
+
+        The file is a header, a fixed-size record per rule, and the UTF-8
+        data of the distinct rule strings that the records point into.
 
         Args:
-            char: The character to check
+            path: The cache file path
+            digest: SHA-256 digest of the rule file the rules were read from
+        """
+        blob = bytearray()
+        offsets = {}
+        def add_string(s):
+            data = s.encode('utf-8')
+            if s not in offsets:
+                offsets[s] = len(blob)
+                blob.extend(data)
+            return offsets[s], len(data)
+
+        records = []
+        for rule in self.rules:
+            from_offset, from_length = add_string(rule.from_str)
+            to_offset, to_length = add_string(rule.to_str)
+            records.append(_CACHE_RULE.pack(from_offset, from_length, to_offset, to_length, rule.flags))
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_CACHE_HEADER.pack(RULE_CACHE_MAGIC, RULE_CACHE_VERSION, digest, len(records), len(blob)))
+            f.write(b"".join(records))
+            f.write(blob)
+        os.replace(tmp_path, path)
+
+def parse_rule_file(path):
+    """
+    Read the conversion rules of a rule file
+
+    Each rule is a line with the quoted string to convert, the quoted string
+    to convert it to, and the rule flags joined by '|' (or 0), for example:
+
+        'sh'     'ш'    X_AC | X_M | X_F
+
+    Blank lines, lines starting with '#', and the "From To Flags" heading
+    with its line of dashes are skipped.
+
+    Args:
+        path: The rule file path
+
+    Returns:
+        A list of (from_str, to_str, flags) tuples, in file order
+
+    Raises:
+        OSError: If the file cannot be read
+        ValueError: If a line is not a valid rule
+    """
+    flag_values = dict(FLAG_NAMES)
+    rules = []
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            stripped = line.strip()
+            if not stripped or stripped.startswith(("#", "-")) or stripped.split()[0] == "From":
+                continue
+
+            m = _RULE_LINE_RE.match(line)
+            if m is None:
+                raise ValueError(f"{path}:{line_number}: invalid rule: {stripped}")
+            try:
+                from_str = ast.literal_eval(m.group(1))
+                to_str = ast.literal_eval(m.group(2))
+            except (ValueError, SyntaxError):
+                raise ValueError(f"{path}:{line_number}: invalid string: {stripped}") from None
+            if not from_str:
+                raise ValueError(f"{path}:{line_number}: empty string to convert")
+
+            flags = 0
+            for name in m.group(3).split("|"):
+                name = name.strip()
+                if name == "0":
+                    continue
+                if name not in flag_values:
+                    raise ValueError(f"{path}:{line_number}: unknown flag {name!r}")
+                flags |= flag_values[name]
+
+            rules.append((from_str, to_str, flags))
+    return rules
+
+def read_rule_cache(path, digest):
+    """
+    Load a rule table from a cache file written by RuleTable.save_cache()
+
+    Args:
+        path: The cache file path
+        digest: SHA-256 digest of the rule file the cache must be built from
+
+    Returns:
+        The RuleTable, or None if the file is missing, unreadable, or was
+        built from a different rule file
+    """
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version, cache_digest, count, blob_size = _CACHE_HEADER.unpack_from(data, 0)
+            if magic != RULE_CACHE_MAGIC or version != RULE_CACHE_VERSION or cache_digest != digest:
+                debug_print("Ignoring stale rule cache %s", path)
+                return None
+
+            blob_start = _CACHE_HEADER.size + count * _CACHE_RULE.size
+            if blob_start + blob_size != len(data):
+                debug_print("Ignoring truncated rule cache %s", path)
+                return None
+            blob = data[blob_start:]
+
+            expanded_rules = []
+            for from_offset, from_length, to_offset, to_length, flags in \
+                    _CACHE_RULE.iter_unpack(data[_CACHE_HEADER.size:blob_start]):
+                expanded_rules.append((
+                    blob[from_offset:from_offset + from_length].decode('utf-8'),
+                    blob[to_offset:to_offset + to_length].decode('utf-8'),
+                    flags))
+    except (OSError, ValueError, struct.error, UnicodeDecodeError):
+        return None
+
+    table = RuleTable(expanded_rules=expanded_rules)
+    table.digest = digest
+    return table
+
+def file_digest(path):
+    """Get the SHA-256 digest of a file, which keys the rule caches"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).digest()
+
+def default_rule_file_path():
+    """Get the path of the rule file shipped with the engine"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), RULE_FILE_NAME)
+
+def default_rule_cache_path():
+    """Get the path of the rule cache compiled at install time"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), RULE_CACHE_NAME)
+
+def find_rule_file():
+    """
+    Find the rule file to use: the user's, the system administrator's, or
+    the one shipped with the engine, in this order
+
+    Returns:
+        The path of the first rule file that exists
+    """
+    config_home = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    for path in (os.path.join(config_home, "ibus-buuz", RULE_FILE_NAME),
+                 os.path.join("/etc", "ibus-buuz", RULE_FILE_NAME)):
+        if os.path.isfile(path):
+            return path
+    return default_rule_file_path()
+
+def compile_rule_file(rule_file, cache_path):
+    """
+    Compile a rule file into a rule cache
+
+    Args:
+        rule_file: The rule file path
+        cache_path: The cache file to write
+
+    Returns:
+        The RuleTable built from the rule file
+    """
+    table = RuleTable(parse_rule_file(rule_file))
+    table.digest = file_digest(rule_file)
+    table.save_cache(cache_path, table.digest)
+    return table
+
+def load_rule_table(rule_file):
+    """
+    Load the rule table of a rule file, from a rule cache if possible
+
+    The cache compiled at install time is used if it was built from this
+    rule file; otherwise a per-user cache in the cache directory is used,
+    and written if it is missing or stale.
+
+    Args:
+        rule_file: The rule file path
+
+    Returns:
+        The RuleTable
+
+    Raises:
+        OSError: If the rule file cannot be read
+        ValueError: If the rule file is not valid
+    """
+    digest = file_digest(rule_file)
+    table = read_rule_cache(default_rule_cache_path(), digest)
+    if table is not None:
+        return table
+
+    user_cache_path = os.path.join(utils.get_cache_dir(), f"rules-{digest.hex()[:16]}.cache")
+    table = read_rule_cache(user_cache_path, digest)
+    if table is not None:
+        return table
+
+    table = RuleTable(parse_rule_file(rule_file))
+    table.digest = digest
+    try:
+        os.makedirs(os.path.dirname(user_cache_path), exist_ok=True)
+        table.save_cache(user_cache_path, digest)
+    except OSError as e:
+        debug_print("Cannot write rule cache %s: %s", user_cache_path, e)
+    return table
+
+# The rule file set with set_rule_file(), or None to look for one
+_rule_file = None
+
+# Whether the shared rule table is a memory-mapped rule trie, see
+# set_mapped_rules()
+_mapped_rules = False
+
+# The rule table shared by all composers, loaded or built on first use
+_shared_rule_table = None
+
+def set_rule_file(path):
+    """
+    Set the rule file that the shared rule table is loaded from, instead of
+    the one found by find_rule_file()
+
+    Args:
+        path: The rule file path, or None to look for one again
+    """
+    global _rule_file, _shared_rule_table
+    _rule_file = path
+    _shared_rule_table = None
+    if _shared_word_cache is not None:
+        _shared_word_cache.clear()
+
+def set_mapped_rules(enabled):
+    """
+    Set whether the shared rule table is used in place from a memory-mapped
+    rule trie (see mapped_table.py) instead of being loaded into the
+    process. Processes that map the same trie share its memory.
+
+    Args:
+        enabled: Whether to map the rule trie
+    """
+    global _mapped_rules, _shared_rule_table
+    _mapped_rules = enabled
+    _shared_rule_table = None
+
+def get_mapped_rules():
+    """Get whether the shared rule table is mapped, see set_mapped_rules()"""
+    return _mapped_rules
+
+def get_rule_file():
+    """
+    Get the rule file that the shared rule table is loaded from
+
+    Returns:
+        The path set with set_rule_file(), or the one found by
+        find_rule_file()
+    """
+    return _rule_file or find_rule_file()
+
+def get_rule_table():
+    """
+    Get the rule table shared by all composers of this process
+
+    Returns:
+        The shared RuleTable, or MappedRuleTable if set_mapped_rules() is
+        enabled. If the rule file cannot be loaded, the rules shipped with
+        the engine are used instead.
+    """
+    global _shared_rule_table
+    if _shared_rule_table is None:
+        if _mapped_rules:
+            from mapped_table import load_mapped_rule_table as load
+        else:
+            load = load_rule_table
+
+        rule_file = get_rule_file()
+        try:
+            _shared_rule_table = load(rule_file)
+        except (OSError, ValueError) as e:
+            if rule_file == default_rule_file_path():
+                raise
+            utils.logger.warning("Cannot load rule file %s, using the default rules: %s", rule_file, e)
+            _shared_rule_table = load(default_rule_file_path())
+    return _shared_rule_table
+
+class WordCache:
+    """
+    A bounded cache of converted words that evicts the least recently used
+    word when it is full. Hits and misses are counted in STATS.
+    """
+    def __init__(self, max_size=DEFAULT_WORD_CACHE_SIZE, max_word_length=MAX_CACHED_WORD_LENGTH):
+        """
+        Args:
+            max_size: The number of words kept
+            max_word_length: Longer words are not cached
+        """
+        self.max_size = max_size
+        self.max_word_length = max_word_length
+        self._words = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._words)
+
+    def get(self, word):
+        """
+        Get the conversion of a word
 
         Returns:
-            True if the character is an input character, False otherwise
+            The converted word, or None if it is not cached
+        """
+        converted = self._words.get(word)
+        if converted is None:
+            STATS.word_cache_misses += 1
+        else:
+            STATS.word_cache_hits += 1
+            self._words.move_to_end(word)
+        return converted
+
+    def put(self, word, converted):
+        """Cache the conversion of a word, evicting the oldest word if full"""
+        if len(word) > self.max_word_length:
+            return
+        self._words[word] = converted
+        if len(self._words) > self.max_size:
+            self._words.popitem(last=False)
+
+    def clear(self):
+        """Remove all words"""
+        self._words.clear()
+
+# The word cache shared by all composers, or None if disabled
+_shared_word_cache = WordCache()
+
+def set_word_cache_size(size):
+    """
+    Set the size of the word cache shared by all composers
+
+    Args:
+        size: The number of words kept, or 0 to disable the cache
+    """
+    global _shared_word_cache
+    _shared_word_cache = WordCache(size) if size > 0 else None
+
+def get_word_cache():
+    """
+    Get the word cache shared by all composers of this process
+
+    Returns:
+        The shared WordCache, or None if it is disabled
+    """
+    return _shared_word_cache
+
+class Composer:
+    """
+    Handles transliteration from Latin to Mongolian Cyrillic
+    """
+    def __init__(self, rule_table=None, word_cache=False, stats=None):
+        """
+        Args:
+            rule_table: The rule table; the shared one if None
+            word_cache: The WordCache of converted words, None for no cache,
+                        or False for the shared one if the rule table is
+                        the shared one
+            stats: The PerfStats that convert() and convert_stream() count
+                   their conversions in; STATS if None
+        """
+        # The rules are shared; a composer only owns its live composition
+        self.table = rule_table or get_rule_table()
+        if word_cache is False:
+            word_cache = get_word_cache() if rule_table is None else None
+        self.word_cache = word_cache
+        self.stats = stats or STATS
+
+        # Live composition state, see append() and backspace()
+        self.reset()
+
+    def dump_rules(self, filename):
+        """
+        Dump the current conversion rules to a file for debugging purposes
+
+        Args:
+            filename: The path to the file where rules should be saved
         """
-        return char == "'" or char == '"' or ('a' <= char <= 'z') or ('A' <= char <= 'Z')
+        self.table.dump_rules(filename)
 
     def convert(self, text):
         """
@@ -279,44 +719,189 @@ class Composer:
         if not text:
             return ""
 
-        result = ""
-        word_flags = X_M  # Start with male word flag
+        # Conversion starts over with each call, so a word always converts
+        # the same way
+        cache = self.word_cache
+        if cache is None or len(text) > cache.max_word_length:
+            return self._get_fst().convert(text, self.stats)
 
-        i = 0
-        while i < len(text):
-            # Try to match rules of different lengths
-            matched = False
+        converted = cache.get(text)
+        if converted is None:
+            converted = self._get_fst().convert(text, self.stats)
+            cache.put(text, converted)
+        return converted
 
-            for length in self.rule_lengths:
-                if i + length > len(text):
-                    continue
+    def convert_stream(self, chunks):
+        """
+        Convert Latin text that arrives in chunks of any size, such as blocks
+        read from a large file
 
-                # Get the substring to match
-                substr = text[i:i+length]
+        The text is converted the way it would be typed: every character that
+        is not an input character ends the word, so word flags start over for
+        each word. A word, or a multi-character rule like "sh", may be split
+        between chunks; the transducer state carries it over.
 
-                # Try to find a matching rule
-                for rule in self.rules:
-                    if rule.from_str == substr and (word_flags & rule.flags) == word_flags:
-                        # Apply the rule
-                        result += rule.to_str
-
-                        # Update word flags
-                        if rule.flags & X_MF:
-                            word_flags = X_F
-                        elif rule.flags & X_MM:
-                            word_flags = X_M
-
-                        # Move the index
-                        i += length
-                        matched = True
-                        break
+        Args:
+            chunks: An iterable of Latin text chunks
 
-                if matched:
-                    break
+        Yields:
+            The converted Mongolian Cyrillic text, piece by piece
+        """
+        fst = self._get_fst()
+        finals = fst.finals
+        start = fst.start
+        state = start
+        cache = self.word_cache
+        stats = self.stats
+
+        for chunk in chunks:
+            result = []
+            pos = 0
+            for m in _WORD_RE.finditer(chunk):
+                if m.start() > pos:
+                    # The current word ended before this run
+                    result.append(finals[state])
+                    result.append(chunk[pos:m.start()])
+                    state = start
+
+                word = m.group()
+                if cache is not None and state == start and m.end() < len(chunk) \
+                        and len(word) <= cache.max_word_length:
+                    # The whole word is in this chunk
+                    converted = cache.get(word)
+                    if converted is None:
+                        converted = fst.convert(word, stats)
+                        cache.put(word, converted)
+                    result.append(converted)
+                else:
+                    state = fst.run(word, state, result, stats)
+                pos = m.end()
 
-            # If no rule matched, copy the character as is
-            if not matched:
-                result += text[i]
-                i += 1
+            if pos < len(chunk):
+                result.append(finals[state])
+                result.append(chunk[pos:])
+                state = start
+
+            if result:
+                yield "".join(result)
+
+        if finals[state]:
+            yield finals[state]
+
+    def _get_fst(self):
+        """
+        Get the transducer of the rule table, which converts whole texts
+        faster than the conversion loop of the table
+
+        Returns:
+            The RuleFST
+        """
+        fst = self.table.fst
+        if fst is None:
+            from fst import get_fst
+            fst = get_fst(self.table)
+        return fst
+
+    def reset(self, word_flags=X_M):
+        """
+        Clear the live composition
+
+        Args:
+            word_flags: The word flags the next input starts with
+        """
+        self.input_text = ""
+        self.output_text = ""
+        # Output of the live composition, one piece per conversion step
+        self.output_pieces = []
+        # State before each conversion step of the live composition:
+        # (input offset, output offset in pieces, word_flags). The last entry
+        # is the state after the whole input.
+        self.checkpoints = [(0, 0, word_flags)]
+
+    def append(self, chars):
+        """
+        Append characters to the live composition
+
+        Args:
+            chars: The Latin characters typed
 
-        return result
+        Returns:
+            The converted text of the whole composition
+        """
+        stable_length = len(self.input_text)
+        self.input_text += chars
+        self._reconvert_tail(stable_length)
+        return self.output_text
+
+    def backspace(self):
+        """
+        Remove the last character of the live composition
+
+        Returns:
+            The converted text of the whole composition
+        """
+        self.input_text = self.input_text[:-1]
+        self._reconvert_tail(len(self.input_text))
+        return self.output_text
+
+    def take_settled(self, keep=0):
+        """
+        Remove the settled beginning of the live composition: the output of
+        the conversion steps that no character typed after the input can
+        change any more. The rest of the composition converts as before,
+        starting with the word flags that the settled part left. They stay
+        even if backspace() erases all the rest; call reset() to start a new
+        word then.
+
+        Args:
+            keep: The number of input characters to keep in the composition
+                  in any case, so that they can still be erased with
+                  backspace()
+
+        Returns:
+            The settled output, which is no longer part of output_text
+        """
+        # A step starting at offset p looks at no more than the longest rule
+        # length of input, so it is settled once all of that has been typed
+        n = len(self.input_text)
+        max_length = self.table.max_length
+        checkpoints = self.checkpoints
+        c = len(checkpoints) - 1
+        while c > 0 and (checkpoints[c - 1][0] + max_length > n or checkpoints[c][0] > n - keep):
+            c -= 1
+        if c == 0:
+            return ""
+
+        i, out_length, word_flags = checkpoints[c]
+        pieces = self.output_pieces
+        settled = "".join(pieces[:out_length])
+        del pieces[:out_length]
+        self.checkpoints = [(offset - i, out_offset - out_length, flags)
+                            for offset, out_offset, flags in checkpoints[c:]]
+        self.input_text = self.input_text[i:]
+        self.output_text = self.output_text[len(settled):]
+        return settled
+
+    def _reconvert_tail(self, stable_length):
+        """
+        Roll the live composition back to the last checkpoint that the changed
+        input cannot affect and convert the rest of the input from there
+
+        Args:
+            stable_length: Length of the input prefix that has not changed
+        """
+        # A step starting at offset p looks at no more than the longest rule
+        # length of input, so it stays valid if all of that is unchanged
+        max_length = self.table.max_length
+        checkpoints = self.checkpoints
+        k = len(checkpoints) - 1
+        while k > 0 and checkpoints[k - 1][0] + max_length > stable_length:
+            k -= 1
+        del checkpoints[k + 1:]
+
+        i, out_length, word_flags = checkpoints[k]
+        pieces = self.output_pieces
+        del pieces[out_length:]
+        self.table.convert_into(self.input_text, i, len(self.input_text), word_flags,
+                                pieces, checkpoints)
+        self.output_text = "".join(pieces)
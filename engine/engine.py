@@ -14,16 +14,108 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
+
 import gi
 gi.require_version('IBus', '1.0')
 from gi.repository import IBus
 
 # Import our custom modules
-from composer import Composer
+from composer import Composer, get_rule_table
+from completion import MAX_CANDIDATES, get_word_index
+from history import get_history
+from stats import STATS
+import utils
 from utils import debug_print
 
-# Maximum composition length
-MAX_COMP_LENGTH = 50
+# When the composition grows longer than this many input characters, its
+# settled beginning is committed, keeping AUTO_COMMIT_KEEP characters that
+# can still be erased with Backspace. This keeps the preedit short however
+# long the user types without a space.
+AUTO_COMMIT_LENGTH = 40
+AUTO_COMMIT_KEEP = 16
+
+# Preedit lengths whose underline attribute list is kept for reuse
+MAX_CACHED_ATTR_LENGTH = 64
+
+# What a key press does, see build_key_classes()
+KEY_INPUT = 0      # type a character of the rule alphabet
+KEY_BACKSPACE = 1  # erase the last character of the composition
+KEY_MODIFIER = 2   # nothing, the key only modifies others
+KEY_COMMIT = 3     # commit the composition and let the key through
+KEY_SELECT = 4     # commit a completion candidate if shown, else KEY_COMMIT
+KEY_CANCEL = 5     # discard the composition
+KEY_RECONVERT = 6  # convert the text selected in the client, see reconvert_selection()
+
+# Keys by what they do, other than input characters. Keys missing from
+# this IBus are left out; any other key is a KEY_COMMIT.
+MODIFIER_KEYS = ("Shift_L", "Shift_R", "Control_L", "Control_R", "Caps_Lock", "Shift_Lock",
+                 "Meta_L", "Meta_R", "Alt_L", "Alt_R", "Super_L", "Super_R", "Hyper_L", "Hyper_R",
+                 "ISO_Level3_Shift", "ISO_Level5_Shift", "Mode_switch", "Num_Lock")
+COMMIT_KEYS = ("Return", "KP_Enter", "Tab", "ISO_Left_Tab", "space", "KP_Space",
+               "Left", "Right", "Up", "Down", "Home", "End", "Page_Up", "Page_Down",
+               "Insert", "Delete", "KP_Left", "KP_Right", "KP_Up", "KP_Down", "KP_Home",
+               "KP_End", "KP_Page_Up", "KP_Page_Down", "KP_Insert", "KP_Delete")
+
+def build_key_classes(table):
+    """
+    Build the table that do_process_key_event() decides each key press with
+
+    Args:
+        table: The rule table, whose rules make up the input characters
+
+    Returns:
+        A dict that maps a keyval to a (class, argument) tuple: the
+        character for KEY_INPUT, the candidate index for KEY_SELECT, and
+        None otherwise
+    """
+    classes = {}
+    def add(names, key_class):
+        for name in names:
+            keyval = getattr(IBus, "KEY_" + name, None)
+            if keyval is not None:
+                classes[keyval] = (key_class, None)
+
+    add(COMMIT_KEYS, KEY_COMMIT)
+    add(MODIFIER_KEYS, KEY_MODIFIER)
+    add(("BackSpace",), KEY_BACKSPACE)
+    add(("Escape",), KEY_CANCEL)
+    add(("F9",), KEY_RECONVERT)
+    for index in range(9):
+        for name in (f"{index + 1}", f"KP_{index + 1}"):
+            keyval = getattr(IBus, "KEY_" + name, None)
+            if keyval is not None:
+                classes[keyval] = (KEY_SELECT, index)
+
+    # Printable Latin-1 characters have the keyval of their code point
+    for rule in table.rules:
+        for char in rule.from_str:
+            if 0x20 < ord(char) <= 0xff and char.isprintable():
+                classes[ord(char)] = (KEY_INPUT, char)
+    return classes
+
+# The key classes of the shared rule table, built for the first engine
+_shared_key_classes = None
+
+def get_key_classes():
+    """Get the key classes of the shared rule table, see build_key_classes()"""
+    global _shared_key_classes
+    if _shared_key_classes is None:
+        _shared_key_classes = build_key_classes(get_rule_table())
+    return _shared_key_classes
+
+# Any key that is not in the key classes
+_OTHER_KEY = (KEY_COMMIT, None)
+
+# Modifiers that Num Lock and Caps Lock leave on, which keys that must be
+# pressed alone ignore; keypad digits only come with Num Lock on
+_LOCK_MASKS = IBus.ModifierType.MOD2_MASK | IBus.ModifierType.LOCK_MASK
+
+# Modifiers that input characters may be typed with
+_INPUT_MASKS = IBus.ModifierType.SHIFT_MASK | _LOCK_MASKS
+
+# Input purposes of fields whose text is never written to the typing history
+_PRIVATE_PURPOSES = (IBus.InputPurpose.PASSWORD, IBus.InputPurpose.PIN)
 
 class BuuzEngine(IBus.Engine):
     """
@@ -34,32 +126,78 @@ class BuuzEngine(IBus.Engine):
     def __init__(self):
         super(BuuzEngine, self).__init__()
 
-        # Create composer instance for transliteration
+        # Create composer instance for transliteration; the compiled rule
+        # table behind it is built once and shared by all engines
         self.composer = Composer()
 
-        # Composition state
-        self.preedit_string = ""
+        # What each key press does, decided with one lookup
+        self._key_classes = get_key_classes()
+
+        # Composition state; the typed input and its conversion are kept
+        # incrementally by the composer. Once _commit_settled() committed
+        # part of it, the rest is not a whole word.
         self.is_composing = False
+        self._partly_committed = False
+
+        # The (text, cursor position, visible) preedit last sent to IBus, or
+        # None if unknown; update_preedit() sends nothing if it is unchanged
+        self._sent_preedit = None
+
+        # Underline attribute lists by preedit length, see _underline()
+        self._underlines = {}
+
+        # Converts large texts off the main loop, created on first use
+        self._async_converter = None
+
+        # What the client supports, as IBus.Capabilite flags
+        self._capabilities = 0
+
+        # What the focused field is for, as an IBus.InputPurpose
+        self._input_purpose = IBus.InputPurpose.FREE_FORM
+
+        # Completion candidates of the composition, from the shared word
+        # index; None if completion is disabled. The PrefixRange of the
+        # last lookup narrows the next one while the user keeps typing.
+        self._word_index = get_word_index()
+        self._prefix_range = None
+        self._candidates = []
+
+        # Counts of the words the user committed, which rank the candidates;
+        # None if disabled
+        self._history = get_history()
 
         debug_print("BuuzEngine initialized")
 
     def do_focus_in(self):
         """Called when the engine gains focus"""
         debug_print("do_focus_in")
+        # The preedit of another input context may have been shown since
+        self._sent_preedit = None
 
     def do_focus_out(self):
         """Called when the engine loses focus"""
         debug_print("do_focus_out")
+        self.cancel_async()
         self.commit_preedit()
 
+    def do_set_capabilities(self, caps):
+        """Called when the client tells what it supports"""
+        self._capabilities = caps
+
+    def do_set_content_type(self, purpose, hints):
+        """Called when the client tells what the focused field is for"""
+        self._input_purpose = purpose
+
     def do_reset(self):
         """Reset the engine state"""
         debug_print("do_reset")
+        self.cancel_async()
         self._reset_state()
 
     def _reset_state(self):
         self.is_composing = False
-        self.preedit_string = ""
+        self.composer.reset()
+        self._partly_committed = False
         self.update_preedit()
 
     def do_process_key_event(self, keyval, keycode, state):
@@ -74,78 +212,284 @@ class BuuzEngine(IBus.Engine):
         Returns:
             True if the key was handled, False otherwise
         """
-        debug_print(f"do_process_key_event(keyval={keyval}, keycode={keycode}, state={state})")
+        # This runs for every key press and release, so the message is not
+        # even passed on unless verbose mode is on
+        if utils.VERBOSE_MODE:
+            debug_print("do_process_key_event(keyval=%s, keycode=%s, state=%s)", keyval, keycode, state)
+
+        start = time.perf_counter()
+        handled = self._process_key_event(keyval, state)
+        elapsed = time.perf_counter() - start
 
+        STATS.key_events += 1
+        STATS.key_event_time += elapsed
+        if elapsed > STATS.key_event_max_time:
+            STATS.key_event_max_time = elapsed
+        return handled
+
+    def _process_key_event(self, keyval, state):
         # Ignore key release events
         if state & IBus.ModifierType.RELEASE_MASK:
             return False
 
-        # Handle special keys
-        if keyval == IBus.KEY_BackSpace:
-            if self.preedit_string:
-                self.preedit_string = self.preedit_string[:-1]
-                self.update_preedit()
-                return True
-            return False
+        # A key may change the text that a conversion in the background was
+        # started for, and must not wait for it
+        if self._async_converter is not None:
+            self._async_converter.cancel()
 
-        # Ignore shift and caps lock keys
-        elif keyval in (IBus.KEY_Shift_L, IBus.KEY_Shift_R, IBus.KEY_Caps_Lock):
-            return False
+        key_class, arg = self._key_classes.get(keyval, _OTHER_KEY)
 
         # Handle regular input
-        elif (len(self.preedit_string) < MAX_COMP_LENGTH and self.composer.should_process_key(keyval) and
-              state & ~IBus.ModifierType.SHIFT_MASK == 0):
+        if key_class == KEY_INPUT and state & ~_INPUT_MASKS == 0:
             # If we're not composing yet, start composition
             if not self.is_composing:
                 self.is_composing = True
 
-            # Convert keyval to character
-            char = chr(keyval)
-
-            # Add to preedit string
-            self.preedit_string += char
+            # Add the character to the composition; only the tail of the
+            # input that the new character can affect is converted again
+            self.composer.append(arg)
+            if len(self.composer.input_text) > AUTO_COMMIT_LENGTH:
+                self._commit_settled()
 
             # Update the display
             self.update_preedit()
             return True
 
-        # If we're composing and a non-handled key is pressed, commit and let it through
+        elif key_class == KEY_BACKSPACE:
+            if self.composer.input_text:
+                self.composer.backspace()
+                if self.composer.input_text:
+                    self.update_preedit()
+                else:
+                    # The composition keeps the word flags of the part that
+                    # _commit_settled() committed; what is typed after all
+                    # the rest is erased starts a new word
+                    self._reset_state()
+                return True
+            return False
+
+        # Modifier keys alone neither type nor commit anything
+        elif key_class == KEY_MODIFIER:
+            return False
+
+        # Number keys select a completion candidate while they are shown
+        elif key_class == KEY_SELECT and self._candidates and state & ~_LOCK_MASKS == 0 \
+                and arg < len(self._candidates):
+            self.commit_candidate(arg)
+            return True
+
+        # Escape drops the composition instead of typing it
+        elif key_class == KEY_CANCEL and self.is_composing:
+            self._reset_state()
+            return True
+
+        # F9 converts the selected text, if the client has a selection
+        elif key_class == KEY_RECONVERT and not self.is_composing and state & ~_LOCK_MASKS == 0:
+            return self.reconvert_selection()
+
+        # If we're composing and any other key is pressed, commit and let it through
         elif self.is_composing:
             self.commit_preedit()
 
         return False
 
     def update_preedit(self):
-        """Update the preedit text"""
+        """
+        Update the preedit text
+
+        Each update is a D-Bus message to the IBus daemon, so nothing is sent
+        if the preedit is the same as the one last sent, for example when a
+        key only made the input longer without changing its conversion, or
+        when an empty composition is reset again.
+        """
+        start = time.perf_counter()
         if self.is_composing:
-            # Convert the input text to Mongolian Cyrillic
-            converted_text = self.composer.convert(self.preedit_string)
+            # The composer keeps the input converted as it is typed
+            converted_text = self.composer.output_text
+            length = len(converted_text)
+            preedit = (converted_text, length, length > 0)
+        else:
+            preedit = ("", 0, False)
 
-            # Create an IBus text with the converted text
+        if preedit == self._sent_preedit:
+            STATS.preedit_updates_skipped += 1
+        elif self.is_composing:
+            # Create an IBus text with the converted text, underlined
             text = IBus.Text.new_from_string(converted_text)
+            text.set_attributes(self._underline(length))
+
+            # Update the preedit text
+            self.update_preedit_text(text, length, length > 0)
+            self._sent_preedit = preedit
+        elif self._sent_preedit is None or self._sent_preedit[2]:
+            # Clear the preedit text
+            self.hide_preedit_text()
+            self._sent_preedit = preedit
+        else:
+            # An invisible preedit needs no hiding
+            STATS.preedit_updates_skipped += 1
+            self._sent_preedit = preedit
+
+        STATS.preedit_updates += 1
+        STATS.update_preedit_time += time.perf_counter() - start
+
+        if self._word_index is not None:
+            self._update_candidates()
+
+    def _update_candidates(self):
+        """
+        Look up the completion candidates of the converted composition and
+        show them in the lookup table, or hide it if there are none
+        """
+        prefix = self.composer.output_text if self.is_composing else ""
+        candidates = []
+        if prefix and not self._partly_committed:
+            # Typing on narrows the words of the previous prefix
+            within = self._prefix_range
+            if within is not None and not prefix.startswith(within.prefix):
+                within = None
+            self._prefix_range = self._word_index.find_prefix(prefix, within)
+            candidates = self._word_index.candidates(self._prefix_range)
+            if self._history is not None:
+                # The words the user commits most come first, even those
+                # the index ranks too low to return; the sort is stable, so
+                # the rest keep their order
+                committed = self._history.completions(prefix, MAX_CANDIDATES)
+                candidates = list(dict.fromkeys(candidates + committed))
+                count = self._history.count
+                candidates.sort(key=lambda word: -count(word))
+                del candidates[MAX_CANDIDATES:]
+        else:
+            self._prefix_range = None
+
+        if candidates == self._candidates:
+            return
+        self._candidates = candidates
+        if candidates:
+            table = IBus.LookupTable.new(len(candidates), 0, False, False)
+            for word in candidates:
+                table.append_candidate(IBus.Text.new_from_string(word))
+            self.update_lookup_table(table, True)
+        else:
+            self.hide_lookup_table()
+
+    def commit_candidate(self, index):
+        """
+        Commit a completion candidate instead of the composition
+
+        Args:
+            index: The position of the candidate in the lookup table
+        """
+        word = self._candidates[index]
+        self.commit_text(IBus.Text.new_from_string(word))
+        STATS.commits += 1
+        self._record(word)
+        self._reset_state()
+
+    def _record(self, word):
+        """
+        Count a committed word in the typing history, unless it was typed
+        into a password or PIN field
+
+        Args:
+            word: The committed word
+        """
+        # Only counted in memory; the history is written to disk by its
+        # flush timer, never while handling a key
+        if self._history is not None and self._input_purpose not in _PRIVATE_PURPOSES:
+            self._history.record(word)
+
+    def _underline(self, length):
+        """
+        Get an attribute list that underlines a preedit
 
-            # Set attributes (underline the text)
+        Args:
+            length: The length of the preedit
+
+        Returns:
+            An IBus.AttrList, shared by all preedits of this length
+        """
+        attrs = self._underlines.get(length)
+        if attrs is None:
             attrs = IBus.AttrList()
-            length = len(converted_text)
             if length > 0:
                 attrs.append(IBus.Attribute.new(IBus.AttrType.UNDERLINE,
                                                IBus.AttrUnderline.SINGLE, 0, length))
-            text.set_attributes(attrs)
+            if length <= MAX_CACHED_ATTR_LENGTH:
+                self._underlines[length] = attrs
+        return attrs
 
-            # Update the preedit text
-            self.update_preedit_text(text, length, length > 0)
-        else:
-            # Clear the preedit text
-            self.hide_preedit_text()
+    def reconvert_selection(self):
+        """
+        Convert the Latin text selected in the client, replacing the
+        selection with the Cyrillic text once it is converted. Committed
+        text replaces the selection in GTK and Qt clients.
+
+        Returns:
+            True if a conversion was started, False if the client does not
+            tell its surrounding text or has no selection
+        """
+        if not self._capabilities & IBus.Capabilite.SURROUNDING_TEXT:
+            return False
+        text, cursor_pos, anchor_pos = self.get_surrounding_text()
+        start, end = sorted((cursor_pos, anchor_pos))
+        selected = text.get_text()[start:end]
+        if not selected:
+            return False
+
+        def replace(converted):
+            # The selection may have been changed with the mouse since
+            text, cursor_pos, anchor_pos = self.get_surrounding_text()
+            start, end = sorted((cursor_pos, anchor_pos))
+            if text.get_text()[start:end] == selected:
+                self.commit_text(IBus.Text.new_from_string(converted))
+                STATS.commits += 1
+
+        debug_print("Reconverting a selection of %d characters", len(selected))
+        self.convert_async(selected, replace)
+        return True
+
+    def convert_async(self, text, callback):
+        """
+        Convert a text, such as the selected text, without blocking key
+        handling, see AsyncConverter. The conversion is cancelled by the
+        next key press, focus change or reset.
+
+        Args:
+            text: The Latin text to convert
+            callback: Called from the main loop with the converted text,
+                      unless the conversion is cancelled
+        """
+        if self._async_converter is None:
+            from async_convert import AsyncConverter
+            self._async_converter = AsyncConverter(self.composer.table)
+        self._async_converter.convert(text, callback)
+
+    def cancel_async(self):
+        """Cancel the conversion started by convert_async(), if it is running"""
+        if self._async_converter is not None:
+            self._async_converter.cancel()
+
+    def _commit_settled(self):
+        """Commit the beginning of the composition that can no longer change"""
+        settled = self.composer.take_settled(AUTO_COMMIT_KEEP)
+        if settled:
+            self.commit_text(IBus.Text.new_from_string(settled))
+            STATS.commits += 1
+            self._partly_committed = True
 
     def commit_preedit(self):
         """Commit the current preedit text"""
         if self.is_composing:
-            # Convert the input text to Mongolian Cyrillic
-            converted_text = self.composer.convert(self.preedit_string)
+            converted_text = self.composer.output_text
 
-            # Commit the text
-            self.commit_text(IBus.Text.new_from_string(converted_text))
+            # Commit the text, unless it was all erased
+            if converted_text:
+                self.commit_text(IBus.Text.new_from_string(converted_text))
+                STATS.commits += 1
+                if not self._partly_committed:
+                    self._record(converted_text)
 
-            # Reset the state
+            # Reset the state; this hides the preedit, which is the only
+            # other message a commit sends
             self._reset_state()
@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import array
+import mmap
+import os
+import re
+import struct
+import time
+
+from composer import X_M
+from stats import STATS
+import utils
+from utils import debug_print
+
+# File name of the transducer compiled at install time, next to this module
+RULE_FST_NAME = "rules.fst"
+
+# Transducer format: a header (magic, version, digest of the rule file, a
+# byte order mark, the number of states, of columns per state, of pieces
+# and of start states, the size of the alphabet in the string data and the
+# size of the string data), then arrays of unsigned 32-bit integers in
+# native byte order:
+#
+#   step_pieces[states * columns]  piece each state outputs for each column
+#   step_states[states * columns]  state each state goes to for each column
+#   finals[states]                 piece of each state when the input ends
+#   piece_offsets[pieces + 1]      pieces are the string data from
+#                                  piece_offsets[k] up to piece_offsets[k + 1]
+#   start_fields[starts * 2]       word flags and state of each start state
+#
+# and the UTF-8 string data: the alphabet, then the pieces. A state is the
+# index of its first step, so that the step of a character is at
+# state + column. Each character of the alphabet has a column, and the last
+# column is that of any other character. The steps are used in place, like
+# a rule trie (see mapped_table.py), so all processes mapping the file
+# share them.
+RULE_FST_MAGIC = b"BUUZFST\0"
+RULE_FST_VERSION = 2
+_BYTE_ORDER_MARK = 0x01020304
+_FST_HEADER = struct.Struct("=8sI32s7I")
+
+# The arrays hold 32-bit integers
+assert array.array('I').itemsize == 4
+
+# Runs of unambiguous characters (see RuleFST._find_unambiguous()) at least
+# this long are converted in bulk. Finding them costs about a third of
+# converting character by character, which only pays off for text that is
+# mostly such runs, such as tables, numbers or indentation. Text is therefore
+# converted in blocks, and only blocks whose beginning is mostly such runs
+# are searched for them.
+MIN_BULK_RUN = 8
+BULK_BLOCK_SIZE = 4096
+BULK_SAMPLE_SIZE = 256
+
+class RuleFST:
+    """
+    A deterministic finite-state transducer that converts like a rule table
+
+    Conversion with a rule table depends only on the word flags and on the
+    input that is a prefix of some rule but not matched yet, since a
+    longer rule may still match it. Each such (word flags, pending input)
+    pair is a state of the transducer. For every character that rules are
+    made of, a state has one step, which gives the output that the
+    character makes certain and the next state. Conversion is then a
+    single pass over the input with one table lookup per character.
+
+    The steps are two flat arrays of integers (see the file format above),
+    which are either compiled into the process or mapped from a file.
+    """
+    def __init__(self, alphabet, step_pieces, step_states, pieces, finals, start_states):
+        """
+        Args:
+            alphabet: The characters that rules are made of, one per column
+            step_pieces: The piece number each state outputs for each
+                         column; the piece of the last column, that of any
+                         other character, comes before the character
+                         itself, which is copied as is
+            step_states: The state each state goes to for each column
+            pieces: The output pieces, indexed by piece number
+            finals: For each state in order, the piece number of the
+                    pending input when the input ends
+            start_states: A dict that maps word flags to the state with
+                          those flags and no pending input
+        """
+        self.alphabet = alphabet
+        self.columns = {char: column for column, char in enumerate(alphabet)}
+        self.other_column = len(alphabet)
+        self.step_pieces = step_pieces
+        self.step_states = step_states
+        self.pieces = pieces
+        width = len(alphabet) + 1
+        self.finals = {k * width: pieces[piece] for k, piece in enumerate(finals)}
+        self.start_states = start_states
+        self.start = start_states[X_M]
+        self._find_unambiguous()
+
+    def _find_unambiguous(self):
+        """
+        Find the characters that convert the same way in every state without
+        pending input, and leave the state as it is: consonants like 'b' or
+        'm' that no longer rule starts with and that do not depend on or
+        change the word flags, and the characters that no rule uses, such
+        as spaces and digits. Runs of them are converted with str.translate.
+        """
+        self.clear_states = frozenset(self.start_states.values())
+        ambiguous = set()
+        translation = {}
+        for char, column in self.columns.items():
+            pieces = {self.step_pieces[state + column] for state in self.clear_states}
+            if len(pieces) == 1 and all(self.step_states[state + column] == state
+                                        for state in self.clear_states):
+                translation[ord(char)] = self.pieces[pieces.pop()]
+            else:
+                ambiguous.add(char)
+        self.translation = translation
+
+        if ambiguous:
+            chars = re.escape("".join(sorted(ambiguous)))
+            # Matches only start where a run starts, which keeps the search
+            # linear however long the runs are
+            self._bulk_run_re = re.compile(f"(?<![^{chars}])[^{chars}]{{{MIN_BULK_RUN},}}")
+        else:
+            self._bulk_run_re = re.compile(f"(?s:.{{{MIN_BULK_RUN},}})")
+
+    def run(self, text, state, out, stats=STATS):
+        """
+        Feed text to the transducer
+
+        Args:
+            text: The Latin text
+            state: The state to start in
+            out: The list the output pieces are appended to
+            stats: The PerfStats the conversion is counted in
+
+        Returns:
+            The state after the text
+        """
+        start_time = time.perf_counter()
+        if len(text) < BULK_SAMPLE_SIZE:
+            state = self._step(text, state, out)
+        else:
+            for pos in range(0, len(text), BULK_BLOCK_SIZE):
+                block = text[pos:pos + BULK_BLOCK_SIZE]
+                if self._bulk_coverage(block[:BULK_SAMPLE_SIZE]) * 2 >= BULK_SAMPLE_SIZE:
+                    state = self._run_bulk(block, state, out)
+                else:
+                    state = self._step(block, state, out)
+
+        stats.convert_calls += 1
+        stats.chars_converted += len(text)
+        stats.convert_time += time.perf_counter() - start_time
+        return state
+
+    def _bulk_coverage(self, text):
+        """Count the characters of text in runs that can be converted in bulk"""
+        return sum(m.end() - m.start() for m in self._bulk_run_re.finditer(text))
+
+    def _run_bulk(self, text, state, out):
+        """Feed text to the transducer, converting unambiguous runs in bulk"""
+        clear_states = self.clear_states
+        pos = 0
+        for m in self._bulk_run_re.finditer(text):
+            run_start, run_end = m.span()
+            if run_start > pos:
+                state = self._step(text[pos:run_start], state, out)
+
+            # Resolve pending input before converting the rest in bulk
+            while state not in clear_states and run_start < run_end:
+                state = self._step(text[run_start], state, out)
+                run_start += 1
+            if run_start < run_end:
+                out.append(text[run_start:run_end].translate(self.translation))
+            pos = run_end
+
+        if pos < len(text):
+            state = self._step(text[pos:], state, out)
+        return state
+
+    def _step(self, text, state, out):
+        """Feed text to the transducer one character at a time"""
+        columns = self.columns
+        other_column = self.other_column
+        step_pieces = self.step_pieces
+        step_states = self.step_states
+        pieces = self.pieces
+        for char in text:
+            column = columns.get(char, other_column)
+            step = state + column
+            out.append(pieces[step_pieces[step]])
+            state = step_states[step]
+            if column == other_column:
+                out.append(char)
+        return state
+
+    def convert(self, text, stats=STATS):
+        """
+        Convert Latin text to Mongolian Cyrillic
+
+        Args:
+            text: The Latin text to convert
+            stats: The PerfStats the conversion is counted in
+
+        Returns:
+            The converted text, the same as RuleTable.convert_into() makes
+        """
+        out = []
+        state = self.run(text, self.start, out, stats)
+        out.append(self.finals[state])
+        return "".join(out)
+
+    def save(self, path, digest):
+        """
+        Save the transducer to a file that read_fst() can map
+
+        Args:
+            path: The file path
+            digest: SHA-256 digest of the rule file the rules were read from
+        """
+        width = len(self.alphabet) + 1
+        states = len(self.step_pieces) // width
+        piece_numbers = {}
+        blob = bytearray(self.alphabet.encode('utf-8'))
+        alphabet_size = len(blob)
+        piece_offsets = array.array('I', [len(blob)])
+        for k, piece in enumerate(self.pieces):
+            blob += piece.encode('utf-8')
+            piece_offsets.append(len(blob))
+            piece_numbers.setdefault(piece, k)
+        finals = array.array('I', (piece_numbers[self.finals[k * width]] for k in range(states)))
+        start_fields = array.array('I')
+        for word_flags, state in self.start_states.items():
+            start_fields.extend((word_flags, state))
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_FST_HEADER.pack(RULE_FST_MAGIC, RULE_FST_VERSION, digest, _BYTE_ORDER_MARK,
+                                     states, width, len(self.pieces), len(self.start_states),
+                                     alphabet_size, len(blob)))
+            for ints in (self.step_pieces, self.step_states, finals, piece_offsets, start_fields):
+                array.array('I', ints).tofile(f)
+            f.write(blob)
+        os.replace(tmp_path, path)
+
+def compile_fst(table):
+    """
+    Compile a rule table into a transducer
+
+    Only the states that can be reached from the start of a word are
+    compiled. Each step is found by running the rule table's own
+    conversion on the pending input and the character, so the transducer
+    converts exactly like the table.
+
+    Args:
+        table: The RuleTable or MappedRuleTable
+
+    Returns:
+        The RuleFST, with its steps in the process
+    """
+    prefixes = set()
+    alphabet = set()
+    for rule in table.rules:
+        for length in range(len(rule.from_str)):
+            prefixes.add(rule.from_str[:length])
+        alphabet.update(rule.from_str)
+    alphabet = "".join(sorted(alphabet))
+    width = len(alphabet) + 1
+
+    # The conversion loop counts its calls, which is not conversion work
+    saved_stats = (STATS.convert_calls, STATS.chars_converted, STATS.convert_time)
+
+    def advance(text, word_flags):
+        """Convert text as far as later input cannot change it"""
+        out = []
+        i = 0
+        while text[i:] not in prefixes:
+            i, word_flags = table.convert_into(text, i, i + 1, word_flags, out)
+        return "".join(out), (word_flags, text[i:])
+
+    def flush(word_flags, pending):
+        """Convert pending input at the end of the input"""
+        out = []
+        word_flags = table.convert_into(pending, 0, len(pending), word_flags, out)[1]
+        return "".join(out), (word_flags, "")
+
+    numbers = {}
+    keys = []
+    def number(key):
+        if key not in numbers:
+            numbers[key] = len(keys) * width
+            keys.append(key)
+        return numbers[key]
+
+    piece_numbers = {}
+    pieces = []
+    def piece_number(piece):
+        if piece not in piece_numbers:
+            piece_numbers[piece] = len(pieces)
+            pieces.append(piece)
+        return piece_numbers[piece]
+
+    number((X_M, ""))
+    step_pieces = array.array('I')
+    step_states = array.array('I')
+    finals = []
+    # keys grows while it is walked, breadth first from the start state
+    for word_flags, pending in keys:
+        for char in alphabet:
+            piece, key = advance(pending + char, word_flags)
+            step_pieces.append(piece_number(piece))
+            step_states.append(number(key))
+
+        piece, key = flush(word_flags, pending)
+        step_pieces.append(piece_number(piece))
+        step_states.append(number(key))
+        finals.append(piece_number(piece))
+
+    start_states = {word_flags: state for (word_flags, pending), state in numbers.items() if pending == ""}
+    STATS.convert_calls, STATS.chars_converted, STATS.convert_time = saved_stats
+    return RuleFST(alphabet, step_pieces, step_states, tuple(pieces), finals, start_states)
+
+def read_fst(path, digest):
+    """
+    Map a transducer from a file written by RuleFST.save()
+
+    Args:
+        path: The file path
+        digest: SHA-256 digest of the rule file the transducer must be
+                compiled from
+
+    Returns:
+        The RuleFST, or None if the file is missing, unreadable, or was
+        compiled from a different rule file
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, fst_digest, byte_order, states, width, piece_count, starts, alphabet_size, string_size = \
+            _FST_HEADER.unpack_from(data, 0)
+    except (OSError, ValueError, struct.error):
+        return None
+
+    if magic != RULE_FST_MAGIC or version != RULE_FST_VERSION or byte_order != _BYTE_ORDER_MARK \
+            or fst_digest != digest:
+        debug_print("Ignoring stale transducer %s", path)
+        return None
+
+    if _FST_HEADER.size + (states * (width * 2 + 1) + piece_count + 1 + starts * 2) * 4 \
+            + string_size != len(data):
+        debug_print("Ignoring truncated transducer %s", path)
+        return None
+
+    view = memoryview(data)
+    offset = _FST_HEADER.size
+    def take(count):
+        nonlocal offset
+        end = offset + count * 4
+        ints = view[offset:end].cast('I')
+        offset = end
+        return ints
+
+    step_pieces = take(states * width)
+    step_states = take(states * width)
+    finals = take(states)
+    piece_offsets = take(piece_count + 1)
+    start_fields = take(starts * 2)
+    strings = view[offset:]
+    try:
+        alphabet = str(strings[:alphabet_size], 'utf-8')
+        # Pieces are looked up for every character, which is fastest from
+        # a tuple; they are few and short
+        pieces = tuple(str(strings[piece_offsets[k]:piece_offsets[k + 1]], 'utf-8')
+                       for k in range(piece_count))
+    except UnicodeDecodeError:
+        return None
+    start_states = {start_fields[k]: start_fields[k + 1] for k in range(0, len(start_fields), 2)}
+    return RuleFST(alphabet, step_pieces, step_states, pieces, finals, start_states)
+
+def default_fst_path():
+    """Get the path of the transducer compiled at install time"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), RULE_FST_NAME)
+
+def load_fst(table):
+    """
+    Get the transducer of a rule table, from a saved one if possible
+
+    The transducer compiled at install time is mapped if it was compiled
+    from the same rule file; otherwise a per-user one in the cache
+    directory is mapped, and written if it is missing or stale. A table
+    that was not read from a rule file gets a transducer of its own.
+
+    Args:
+        table: The RuleTable or MappedRuleTable
+
+    Returns:
+        The RuleFST
+    """
+    digest = table.digest
+    if digest is None:
+        return compile_fst(table)
+
+    fst = read_fst(default_fst_path(), digest)
+    if fst is not None:
+        return fst
+
+    user_fst_path = os.path.join(utils.get_cache_dir(), f"rules-{digest.hex()[:16]}.fst")
+    fst = read_fst(user_fst_path, digest)
+    if fst is not None:
+        return fst
+
+    fst = compile_fst(table)
+    try:
+        os.makedirs(os.path.dirname(user_fst_path), exist_ok=True)
+        fst.save(user_fst_path, digest)
+    except OSError as e:
+        debug_print("Cannot write transducer %s: %s", user_fst_path, e)
+        return fst
+    # Map the file written, so that the compiled steps can be freed
+    return read_fst(user_fst_path, digest) or fst
+
+def get_fst(table):
+    """
+    Get the transducer of a rule table, loading it on first use
+
+    Args:
+        table: The RuleTable or MappedRuleTable
+
+    Returns:
+        The RuleFST, which is kept in table.fst
+    """
+    if table.fst is None:
+        table.fst = load_fst(table)
+    return table.fst
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import collections
+import heapq
+import itertools
+import os
+import time
+
+from stats import STATS
+import utils
+from utils import debug_print
+
+# File name of the history log, in the data directory
+HISTORY_FILE_NAME = "history.log"
+
+# Seconds between writes of the words committed since the last write
+HISTORY_FLUSH_INTERVAL = 30
+
+# The log is compacted when it has this many more lines than words
+COMPACT_EXTRA_LINES = 10000
+
+# Words kept when the log is compacted; the least used ones are dropped
+MAX_HISTORY_WORDS = 100000
+
+# Completions of a prefix that this many words start with, such as a single
+# letter, take milliseconds to find, so they are kept until a word with
+# that prefix is recorded
+CACHE_MIN_MATCHES = 1024
+
+class TypingHistory:
+    """
+    How often the user committed each word, kept in an append-only log
+
+    Recording a word only counts it in memory. flush() appends the counts
+    since the last flush to the log as "count<TAB>word" lines, and rewrites
+    the log with one line per word once it has grown too long. The log is
+    read by load(); until then, count() and completions() know only the
+    words recorded since startup.
+    """
+    def __init__(self, path):
+        """
+        Args:
+            path: The history log path
+        """
+        self.path = path
+        self.loaded = False
+        self._counts = collections.Counter()
+        # The words of _counts, sorted, and the completions kept by
+        # prefix, for completions()
+        self._words = []
+        self._completions = {}
+        # Words recorded since the last flush
+        self._pending = collections.Counter()
+        # Lines in the log, once loaded
+        self._log_lines = 0
+
+    def record(self, word):
+        """Count a committed word; this does no I/O"""
+        if word not in self._counts:
+            bisect.insort(self._words, word)
+        for end in range(len(word)):
+            self._completions.pop(word[:end], None)
+        self._counts[word] += 1
+        self._pending[word] += 1
+
+    def count(self, word):
+        """Get how often a word was committed"""
+        return self._counts.get(word, 0)
+
+    def completions(self, prefix, count):
+        """
+        Get the words committed most that start with a prefix, other than
+        the prefix itself
+
+        Args:
+            prefix: The prefix
+            count: The number of words wanted
+
+        Returns:
+            A list of up to count words, most committed first
+        """
+        cached = self._completions.get(prefix)
+        if cached is not None and len(cached) >= count:
+            return cached[:count]
+
+        words = self._words
+        start = bisect.bisect_right(words, prefix)
+        matches = list(itertools.takewhile(lambda word: word.startswith(prefix),
+                                           itertools.islice(words, start, None)))
+        best = heapq.nlargest(count, matches, key=self._counts.__getitem__)
+        if len(matches) >= CACHE_MIN_MATCHES:
+            self._completions[prefix] = best
+        return best
+
+    def load(self):
+        """
+        Read the log and add its counts to those recorded since startup. A
+        line cut short by a crash while it was appended is skipped.
+        """
+        if self.loaded:
+            return
+        start = time.perf_counter()
+        counts = collections.Counter()
+        lines = 0
+        try:
+            with open(self.path, encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    lines += 1
+                    count, _, word = line.rstrip("\n").partition("\t")
+                    if word and "\t" not in word and line.endswith("\n") and count.isdigit():
+                        counts[word] += int(count)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            utils.logger.warning("Cannot read typing history %s: %s", self.path, e)
+
+        # The words recorded since startup are in the log, except those
+        # that were not flushed yet
+        counts.update(self._pending)
+        self._counts = counts
+        self._words = sorted(counts)
+        self._completions.clear()
+        self._log_lines = lines
+        self.loaded = True
+        STATS.history_load_time += time.perf_counter() - start
+        debug_print("Loaded typing history of %d words in %.1f ms", len(counts),
+                    (time.perf_counter() - start) * 1e3)
+
+    def flush(self):
+        """
+        Write the words recorded since the last flush to the log, compacting
+        it if it has grown too long
+
+        Returns:
+            False if the log cannot be written; the words are then kept for
+            the next flush
+        """
+        if not self._pending:
+            return True
+        start = time.perf_counter()
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if self.loaded and self._log_lines + len(self._pending) > len(self._counts) + COMPACT_EXTRA_LINES:
+                self._compact()
+            else:
+                data = "".join(f"{count}\t{word}\n" for word, count in self._pending.items()).encode('utf-8')
+                with open(self.path, 'a+b') as f:
+                    # End a line cut short by a crash with a tab, which no
+                    # word has, so that it stays the only one lost
+                    if f.seek(0, os.SEEK_END) > 0:
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n":
+                            data = b"\t\n" + data
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._log_lines += len(self._pending)
+        except OSError as e:
+            utils.logger.warning("Cannot write typing history %s: %s", self.path, e)
+            return False
+
+        self._pending.clear()
+        STATS.history_flushes += 1
+        STATS.history_flush_time += time.perf_counter() - start
+        return True
+
+    def _compact(self):
+        """
+        Rewrite the log with one line per word. The new log is written to a
+        temporary file that replaces the log only once it is complete, so a
+        crash leaves either the old log or the new one.
+        """
+        if len(self._counts) > MAX_HISTORY_WORDS:
+            self._counts = collections.Counter(dict(self._counts.most_common(MAX_HISTORY_WORDS)))
+            self._words = sorted(self._counts)
+            self._completions.clear()
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("".join(f"{count}\t{word}\n" for word, count in self._counts.items()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._log_lines = len(self._counts)
+        debug_print("Compacted typing history to %d words", len(self._counts))
+
+def default_history_path():
+    """Get the path of the history log of the user"""
+    return os.path.join(utils.get_data_dir(), HISTORY_FILE_NAME)
+
+# The typing history shared by all engines, or None if disabled
+_shared_history = None
+
+def set_history(enabled, path=None):
+    """
+    Set whether committed words are recorded
+
+    Args:
+        enabled: Whether to record committed words
+        path: The history log path, or None for default_history_path()
+    """
+    global _shared_history
+    _shared_history = TypingHistory(path or default_history_path()) if enabled else None
+
+def get_history():
+    """
+    Get the typing history shared by all engines of this process
+
+    Returns:
+        The TypingHistory, or None if it is disabled
+    """
+    return _shared_history
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import array
+import mmap
+import os
+import struct
+import time
+from bisect import bisect_left
+
+from composer import (ConversionRule, RuleTable, X_F, X_M, X_MF, X_MM,
+                      default_rule_file_path, file_digest, parse_rule_file)
+from stats import STATS
+import utils
+from utils import debug_print
+
+# File name of the rule trie compiled at install time, next to this module
+RULE_TRIE_NAME = "rules.trie"
+
+# Rule trie format: a header (magic, version, digest of the rule file, a
+# byte order mark, the number of nodes, edges and rules, the size of the
+# string data, the length of the longest rule), then arrays of unsigned
+# 32-bit integers in native byte order:
+#
+#   node_parent[nodes]        parent of each node; the root is node 0
+#   node_edges[nodes + 1]     first edge of each node; edges of node k are
+#                             node_edges[k] up to node_edges[k + 1]
+#   node_rules[nodes + 1]     first rule of each node, the same way
+#   edge_chars[edges]         code point of each edge, ascending per node
+#   edge_children[edges]      node each edge leads to
+#   rule_fields[rules * 5]    from offset, from length, to offset, to length
+#                             and flags of each rule, grouped by node
+#
+# and the UTF-8 string data. The arrays are used in place through
+# memoryviews of the mapping, so all processes mapping the file share its
+# pages.
+RULE_TRIE_MAGIC = b"BUUZTRIE"
+RULE_TRIE_VERSION = 1
+_BYTE_ORDER_MARK = 0x01020304
+_TRIE_HEADER = struct.Struct("=8sI32s6I")
+_RULE_FIELDS = 5
+
+# The arrays hold 32-bit integers
+assert array.array('I').itemsize == 4
+
+class MappedRuleTable:
+    """
+    A read-only rule table used in place from a memory-mapped rule trie
+
+    It converts like RuleTable, but keeps no rule objects of its own: the
+    trie, the rules and their strings stay in the mapped file.
+    """
+    def __init__(self, path, digest):
+        """
+        Args:
+            path: The rule trie file path
+            digest: SHA-256 digest of the rule file the trie must be built from
+
+        Raises:
+            OSError: If the file cannot be mapped
+            ValueError: If the file is not a rule trie of this rule file
+        """
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, trie_digest, byte_order, nodes, edges, rules, string_size, max_length = \
+            _TRIE_HEADER.unpack_from(self._map, 0)
+        if magic != RULE_TRIE_MAGIC or version != RULE_TRIE_VERSION or byte_order != _BYTE_ORDER_MARK:
+            raise ValueError(f"{path} is not a rule trie of this version")
+        if trie_digest != digest:
+            raise ValueError(f"{path} was built from a different rule file")
+
+        view = memoryview(self._map)
+        offset = _TRIE_HEADER.size
+        def take(count):
+            nonlocal offset
+            end = offset + count * 4
+            if end > len(view):
+                raise ValueError(f"{path} is truncated")
+            ints = view[offset:end].cast('I')
+            offset = end
+            return ints
+
+        self._node_parent = take(nodes)
+        self._node_edges = take(nodes + 1)
+        self._node_rules = take(nodes + 1)
+        self._edge_chars = take(edges)
+        self._edge_children = take(edges)
+        self._rule_fields = take(rules * _RULE_FIELDS)
+        if offset + string_size != len(view):
+            raise ValueError(f"{path} is truncated")
+        self._strings = view[offset:]
+        self.rule_count = rules
+        self.max_length = max_length
+        self.digest = digest
+
+        # The transducer compiled from these rules, see fst.get_fst()
+        self.fst = None
+
+        # The inverse of these rules, see reverse.get_reverse_index()
+        self.reverse_index = None
+
+    def _string(self, offset, length):
+        return str(self._strings[offset:offset + length], 'utf-8')
+
+    @property
+    def rules(self):
+        """
+        The rules as ConversionRule objects, in trie order; rules with the
+        same from_str keep the order they are matched in
+        """
+        fields = self._rule_fields
+        return tuple(
+            ConversionRule(self._string(fields[k], fields[k + 1]),
+                           self._string(fields[k + 2], fields[k + 3]),
+                           fields[k + 4])
+            for k in range(0, len(fields), _RULE_FIELDS))
+
+    dump_rules = RuleTable.dump_rules
+
+    def convert_into(self, text, i, stop, word_flags, out, checkpoints=None):
+        """
+        Convert input, appending one piece of output per conversion step
+
+        Works like RuleTable.convert_into(), walking the mapped trie.
+        """
+        start_time = time.perf_counter()
+        start = i
+        node_parent = self._node_parent
+        node_edges = self._node_edges
+        node_rules = self._node_rules
+        edge_chars = self._edge_chars
+        edge_children = self._edge_children
+        fields = self._rule_fields
+        n = len(text)
+        while i < stop:
+            # Walk the trie as far as the input allows
+            node = 0
+            j = i
+            while j < n:
+                char = ord(text[j])
+                hi = node_edges[node + 1]
+                k = bisect_left(edge_chars, char, node_edges[node], hi)
+                if k == hi or edge_chars[k] != char:
+                    break
+                node = edge_children[k]
+                j += 1
+
+            # Back off from the longest match to the first rule that fits the
+            # word
+            rule = -1
+            while node != 0:
+                for k in range(node_rules[node] * _RULE_FIELDS, node_rules[node + 1] * _RULE_FIELDS, _RULE_FIELDS):
+                    if (word_flags & fields[k + 4]) == word_flags:
+                        rule = k
+                        break
+                if rule >= 0:
+                    break
+                node = node_parent[node]
+                j -= 1
+
+            if rule >= 0:
+                # Apply the rule
+                out.append(self._string(fields[rule + 2], fields[rule + 3]))
+
+                # Update word flags
+                flags = fields[rule + 4]
+                if flags & X_MF:
+                    word_flags = X_F
+                elif flags & X_MM:
+                    word_flags = X_M
+                i = j
+            else:
+                # If no rule matched, copy the character as is
+                out.append(text[i])
+                i += 1
+
+            if checkpoints is not None:
+                checkpoints.append((i, len(out), word_flags))
+
+        STATS.convert_calls += 1
+        STATS.chars_converted += i - start
+        STATS.convert_time += time.perf_counter() - start_time
+        return i, word_flags
+
+def save_rule_trie(table, path, digest):
+    """
+    Write the trie of a rule table to a rule trie file
+
+    Args:
+        table: The RuleTable
+        path: The rule trie file path
+        digest: SHA-256 digest of the rule file the rules were read from
+    """
+    # Number the nodes breadth first, so the edges and rules of each node
+    # are contiguous
+    nodes = [table.trie]
+    numbers = {id(table.trie): 0}
+    for node in nodes:
+        for char in sorted(node.children):
+            child = node.children[char]
+            numbers[id(child)] = len(nodes)
+            nodes.append(child)
+
+    blob = bytearray()
+    offsets = {}
+    def add_string(s):
+        data = s.encode('utf-8')
+        if s not in offsets:
+            offsets[s] = len(blob)
+            blob.extend(data)
+        return offsets[s], len(data)
+
+    node_parent = array.array('I')
+    node_edges = array.array('I')
+    node_rules = array.array('I')
+    edge_chars = array.array('I')
+    edge_children = array.array('I')
+    rule_fields = array.array('I')
+    for node in nodes:
+        node_parent.append(numbers[id(node.parent)] if node.parent is not None else 0)
+        node_edges.append(len(edge_chars))
+        for char in sorted(node.children):
+            edge_chars.append(ord(char))
+            edge_children.append(numbers[id(node.children[char])])
+        node_rules.append(len(rule_fields) // _RULE_FIELDS)
+        for rule in node.rules:
+            rule_fields.extend(add_string(rule.from_str) + add_string(rule.to_str) + (rule.flags,))
+    node_edges.append(len(edge_chars))
+    node_rules.append(len(rule_fields) // _RULE_FIELDS)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_TRIE_HEADER.pack(RULE_TRIE_MAGIC, RULE_TRIE_VERSION, digest, _BYTE_ORDER_MARK,
+                                  len(nodes), len(edge_chars), len(rule_fields) // _RULE_FIELDS,
+                                  len(blob), table.max_length))
+        for ints in (node_parent, node_edges, node_rules, edge_chars, edge_children, rule_fields):
+            ints.tofile(f)
+        f.write(blob)
+    os.replace(tmp_path, path)
+
+def default_rule_trie_path():
+    """Get the path of the rule trie compiled at install time"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), RULE_TRIE_NAME)
+
+def compile_rule_trie(rule_file, trie_path):
+    """
+    Compile a rule file into a rule trie
+
+    Args:
+        rule_file: The rule file path
+        trie_path: The rule trie file to write
+    """
+    save_rule_trie(RuleTable(parse_rule_file(rule_file)), trie_path, file_digest(rule_file))
+
+def load_mapped_rule_table(rule_file):
+    """
+    Map the rule trie of a rule file
+
+    The trie compiled at install time is shared by every user of the rule
+    file shipped with the engine. Other rule files get a per-user trie in
+    the cache directory, written if it is missing or stale, which is shared
+    by the processes of that user.
+
+    Args:
+        rule_file: The rule file path
+
+    Returns:
+        The MappedRuleTable
+
+    Raises:
+        OSError: If the rule file cannot be read or the trie cannot be written
+        ValueError: If the rule file is not valid
+    """
+    digest = file_digest(rule_file)
+    try:
+        return MappedRuleTable(default_rule_trie_path(), digest)
+    except (OSError, ValueError) as e:
+        if rule_file == default_rule_file_path():
+            debug_print("Cannot map installed rule trie: %s", e)
+
+    user_trie_path = os.path.join(utils.get_cache_dir(), f"rules-{digest.hex()[:16]}.trie")
+    try:
+        return MappedRuleTable(user_trie_path, digest)
+    except (OSError, ValueError):
+        pass
+
+    os.makedirs(os.path.dirname(user_trie_path), exist_ok=True)
+    compile_rule_trie(rule_file, user_trie_path)
+    return MappedRuleTable(user_trie_path, digest)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import cProfile
+import os
+import sys
+import threading
+import time
+
+import utils
+from utils import debug_print
+
+# Seconds a profile runs before it stops by itself
+PROFILE_DURATION = 60
+
+# Seconds between stack samples of the main thread
+SAMPLE_INTERVAL = 0.001
+
+class MainLoopProfiler:
+    """
+    Profiles the running process for a bounded time, for performance
+    problems that only show on a user's desktop
+
+    Two files are written when the profile stops, named after the process
+    and the start time:
+
+      profile-PID-TIME.pstats   cProfile statistics of every function,
+                                for pstats, snakeviz and the like
+      profile-PID-TIME.folded   stacks of the main thread, one
+                                "caller;callee microseconds" line per
+                                stack, for flamegraph.pl and speedscope
+
+    Both cover whatever runs in the main thread, which is every main loop
+    callback, such as do_process_key_event() and the conversions it does.
+    The stacks are sampled every SAMPLE_INTERVAL by a thread of their own,
+    which charges each one the CPU time the main thread used since the
+    last sample; so the time the main loop waits for events, and the CPU
+    time of other threads such as the conversion worker, are not counted.
+    cProfile only profiles the thread that enables it, so the sampler is
+    not in the .pstats profile either.
+    """
+    def __init__(self, out_dir=None):
+        """
+        Args:
+            out_dir: The directory the profiles are written to; the cache
+                     directory if None
+        """
+        self.out_dir = out_dir or utils.get_cache_dir()
+        self._profile = None
+        self._stacks = None
+        self._base_path = None
+        self._sampler = None
+        self._stop_sampling = None
+
+    @property
+    def running(self):
+        """Whether a profile is running"""
+        return self._profile is not None
+
+    def start(self):
+        """Start profiling; call stop() to write the profile"""
+        if self.running:
+            return
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self._base_path = os.path.join(self.out_dir, f"profile-{os.getpid()}-{stamp}")
+        self._stacks = collections.Counter()
+        self._stop_sampling = threading.Event()
+        self._sampler = threading.Thread(target=self._sample,
+                                         args=(threading.main_thread().ident, self._stop_sampling),
+                                         name="buuz-profiler", daemon=True)
+        self._sampler.start()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        debug_print("Profiling started")
+
+    def stop(self):
+        """
+        Stop profiling and write the profile
+
+        Returns:
+            The paths of the files written, or an empty tuple if no profile
+            was running
+
+        Raises:
+            OSError: If the profile cannot be written
+        """
+        if not self.running:
+            return ()
+        self._profile.disable()
+        self._stop_sampling.set()
+        self._sampler.join()
+        profile, stacks = self._profile, self._stacks
+        self._profile = self._stacks = self._sampler = self._stop_sampling = None
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        pstats_path = self._base_path + ".pstats"
+        folded_path = self._base_path + ".folded"
+        profile.dump_stats(pstats_path)
+        with open(folded_path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        debug_print("Profile written to %s and %s", pstats_path, folded_path)
+        return pstats_path, folded_path
+
+    def _sample(self, thread_id, stop):
+        """
+        Count the stacks a thread spends CPU time in, outermost call first,
+        until stop is set; runs in the sampler thread
+
+        Args:
+            thread_id: The ident of the thread to sample
+            stop: The threading.Event that ends sampling
+        """
+        clock = time.pthread_getcpuclockid(thread_id)
+        stacks = self._stacks
+        last = time.clock_gettime(clock)
+        while not stop.wait(SAMPLE_INTERVAL):
+            now = time.clock_gettime(clock)
+            used = round((now - last) * 1e6)
+            if used <= 0:
+                # The main thread was waiting, such as for events
+                continue
+            last = now
+
+            frame = sys._current_frames().get(thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if names:
+                stacks[";".join(reversed(names))] += used
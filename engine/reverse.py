@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from composer import X_M, X_F, Composer, get_rule_table
+
+# The live composition that checks the Latin typed so far is trimmed to its
+# unsettled end once it is this long, so it stays short for long texts. The
+# last REVERSE_KEEP_LENGTH characters stay in it, so that the inputs chosen
+# for them can still be taken back.
+REVERSE_SETTLE_LENGTH = 64
+REVERSE_KEEP_LENGTH = 16
+
+# Inputs taken back before a character that no input fits is copied as is
+MAX_BACKTRACK = 64
+
+class ReverseIndex:
+    """
+    The inverse of a rule table: for each word state (X_M or X_F), the Latin
+    inputs that convert to a Cyrillic string, best first
+
+    Only the rule that conversion would pick for an input in that state is
+    inverted, and only if its input has no Cyrillic letters: a Cyrillic
+    vowel that a rule keeps as it is would otherwise be typed as itself
+    rather than in Latin. Among inputs with the same output, the shortest
+    comes first, then the one with the fewest capitals (so 'Ш' is typed
+    "Sh" rather than "SH").
+    """
+    def __init__(self, table):
+        """
+        Args:
+            table: The RuleTable or MappedRuleTable to invert
+        """
+        self.inputs = {}
+        # First characters of the outputs of any state
+        self.output_starts = set()
+        # Characters of the inputs of any rule; any other character ends
+        # the word it follows
+        self.input_chars = set()
+        max_output = 1
+        for state in (X_M, X_F):
+            seen = set()
+            inputs = {}
+            for rule in table.rules:
+                self.input_chars.update(rule.from_str)
+                # The first rule of an input that fits the word is the one
+                # conversion uses
+                if rule.from_str in seen or (state & rule.flags) != state:
+                    continue
+                seen.add(rule.from_str)
+                if rule.to_str and rule.from_str.isascii():
+                    inputs.setdefault(rule.to_str, []).append(rule.from_str)
+                    self.output_starts.add(rule.to_str[0])
+                    max_output = max(max_output, len(rule.to_str))
+            for to_str, from_strs in inputs.items():
+                from_strs.sort(key=lambda s: (len(s), sum(c.isupper() for c in s), s))
+                inputs[to_str] = tuple(from_strs)
+            self.inputs[state] = inputs
+
+        # Output lengths to try at each position, longest first
+        self.output_lengths = tuple(range(max_output, 0, -1))
+
+def get_reverse_index(table):
+    """
+    Get the inverse of a rule table, building it on first use
+
+    Args:
+        table: The RuleTable or MappedRuleTable
+
+    Returns:
+        The ReverseIndex, which is kept in table.reverse_index
+    """
+    if table.reverse_index is None:
+        table.reverse_index = ReverseIndex(table)
+    return table.reverse_index
+
+class ReverseConverter:
+    """
+    Converts Mongolian Cyrillic back to the Latin input that Composer.convert()
+    converts to it
+
+    The text is read in one pass. At each position, the longest Cyrillic
+    string the index knows is looked up for the current word state, and its
+    Latin inputs are tried best first. Each input is typed into a live
+    composition, which checks that it converts as intended together with the
+    input before it: 'с' followed by 'х' is typed "sx" since "sh" converts
+    to 'ш'. When no input fits, the inputs chosen before are taken back and
+    their next inputs tried: in 'эүь', 'ү' is typed "w" rather than "u",
+    since "u'" would make 'ү' alone. Characters that no input converts to,
+    such as spaces, digits and Latin letters, are copied as is; the inputs
+    before them are settled there, so that backtracking never reaches past
+    the last word.
+    """
+    def __init__(self, rule_table=None):
+        """
+        Args:
+            rule_table: The rule table; the shared one if None
+        """
+        self.table = rule_table or get_rule_table()
+        self.index = get_reverse_index(self.table)
+        self._composer = Composer(self.table, word_cache=None)
+        # Options by word state and the text they are looked up for, see
+        # _options(); there are few distinct ones, as outputs are short
+        self._options_cache = {}
+
+    def convert(self, text):
+        """
+        Convert Mongolian Cyrillic text to Latin
+
+        Args:
+            text: The Cyrillic text to convert
+
+        Returns:
+            The Latin text
+        """
+        composer = self._composer
+        composer.reset()
+        output_starts = self.index.output_starts
+        input_chars = self.index.input_chars
+        # Inputs of the text before the live composition
+        settled = []
+        # The inputs chosen in the live composition: (position in text,
+        # options, index of the option chosen), where the options are the
+        # (input, output length) tuples tried at that position, best first
+        chosen = []
+        # Position in text where the live composition starts
+        base = 0
+        pos = 0
+        options = None
+        # Inputs taken back since the text last got further than furthest
+        backtracked = 0
+        furthest = 0
+        n = len(text)
+        while pos < n:
+            if options is None:
+                options = self._options(text, pos, composer.checkpoints[-1][2])
+                index = 0
+
+            while index < len(options):
+                from_str, length = options[index]
+                composer.append(from_str)
+                if composer.output_text == text[base:pos + length]:
+                    break
+                self._erase(from_str)
+                index += 1
+            else:
+                if chosen and text[pos] in output_starts and backtracked < MAX_BACKTRACK:
+                    # Take back the last input and try the next one there
+                    backtracked += 1
+                    pos, options, index = chosen.pop()
+                    self._erase(options[index][0])
+                    index += 1
+                    continue
+
+                # No rule makes this character, or nothing fits after the
+                # input before it, so it is copied as is. If it does not
+                # convert to itself, such as a Latin letter, or it ends the
+                # word, the inputs before it are settled and the live
+                # composition starts over after it, in the word state it
+                # leaves; only the output after it is compared from then on.
+                options = ((text[pos], 1),)
+                index = 0
+                composer.append(text[pos])
+                if text[pos] not in input_chars or composer.output_text != text[base:pos + 1]:
+                    settled.extend(options[index][0] for _, options, index in chosen)
+                    settled.append(text[pos])
+                    chosen = []
+                    pos += 1
+                    base = pos
+                    composer.reset(composer.checkpoints[-1][2])
+                    options = None
+                    if pos > furthest:
+                        furthest = pos
+                        backtracked = 0
+                    continue
+
+            chosen.append((pos, options, index))
+            pos += options[index][1]
+            options = None
+            if pos > furthest:
+                furthest = pos
+                backtracked = 0
+
+            if len(composer.input_text) > REVERSE_SETTLE_LENGTH:
+                before = len(composer.input_text)
+                base += len(composer.take_settled(REVERSE_KEEP_LENGTH))
+                # Inputs that were settled can no longer be taken back
+                taken = before - len(composer.input_text)
+                while taken > 0:
+                    _, done_options, done_index = chosen.pop(0)
+                    settled.append(done_options[done_index][0])
+                    taken -= len(done_options[done_index][0])
+
+        settled.extend(options[index][0] for _, options, index in chosen)
+        return "".join(settled)
+
+    def _options(self, text, pos, state):
+        """
+        Get the inputs that make the text at a position in a word state
+
+        Returns:
+            A tuple of (input, output length) tuples, the inputs of the
+            longest outputs first, each best first
+        """
+        output_lengths = self.index.output_lengths
+        key = (state, text[pos:pos + output_lengths[0]])
+        options = self._options_cache.get(key)
+        if options is None:
+            inputs = self.index.inputs[state]
+            found = []
+            for length in output_lengths:
+                from_strs = inputs.get(key[1][:length])
+                if from_strs is not None and len(key[1]) >= length:
+                    found.extend((from_str, length) for from_str in from_strs)
+            options = self._options_cache[key] = tuple(found)
+        return options
+
+    def _erase(self, from_str):
+        """Take an input back from the live composition"""
+        for _ in from_str:
+            self._composer.backspace()
+
+    def convert_batch(self, texts):
+        """
+        Convert many Mongolian Cyrillic texts to Latin, such as the lines of
+        a corpus
+
+        Args:
+            texts: An iterable of Cyrillic texts
+
+        Returns:
+            A list of the Latin texts, in order
+        """
+        convert = self.convert
+        return [convert(text) for text in texts]
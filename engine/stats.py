@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import time
+
+class PerfStats:
+    """
+    Performance counters and timers of the running process. Times are in
+    seconds, as measured with time.perf_counter().
+    """
+    __slots__ = (
+        'start_time',
+        'key_events', 'key_event_time', 'key_event_max_time',
+        'preedit_updates', 'preedit_updates_skipped', 'update_preedit_time',
+        'convert_calls', 'chars_converted', 'convert_time',
+        'commits', 'rule_table_build_time',
+        'word_cache_hits', 'word_cache_misses',
+        'async_conversions', 'async_cancelled', 'async_convert_time',
+        'completion_lookups', 'completion_time',
+        'history_flushes', 'history_flush_time', 'history_load_time',
+    )
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Set all counters and timers to zero"""
+        self.start_time = time.time()
+        self.key_events = 0
+        self.key_event_time = 0.0
+        self.key_event_max_time = 0.0
+        self.preedit_updates = 0
+        self.preedit_updates_skipped = 0
+        self.update_preedit_time = 0.0
+        self.convert_calls = 0
+        self.chars_converted = 0
+        self.convert_time = 0.0
+        self.commits = 0
+        self.rule_table_build_time = 0.0
+        self.word_cache_hits = 0
+        self.word_cache_misses = 0
+        self.async_conversions = 0
+        self.async_cancelled = 0
+        self.async_convert_time = 0.0
+        self.completion_lookups = 0
+        self.completion_time = 0.0
+        self.history_flushes = 0
+        self.history_flush_time = 0.0
+        self.history_load_time = 0.0
+
+    def as_dict(self):
+        """
+        Get the counters and timers, with averages in microseconds
+
+        Returns:
+            A dict that can be serialized as JSON
+        """
+        def average_us(total, count):
+            return total / count * 1e6 if count else 0.0
+
+        return {
+            'pid': os.getpid(),
+            'uptime_s': time.time() - self.start_time,
+            'key_events': self.key_events,
+            'key_event_avg_us': average_us(self.key_event_time, self.key_events),
+            'key_event_max_us': self.key_event_max_time * 1e6,
+            'preedit_updates': self.preedit_updates,
+            'preedit_updates_skipped': self.preedit_updates_skipped,
+            'update_preedit_avg_us': average_us(self.update_preedit_time, self.preedit_updates),
+            'convert_calls': self.convert_calls,
+            'chars_converted': self.chars_converted,
+            'convert_time_s': self.convert_time,
+            'convert_avg_us_per_char': average_us(self.convert_time, self.chars_converted),
+            'commits': self.commits,
+            'rule_table_build_ms': self.rule_table_build_time * 1e3,
+            'word_cache_hits': self.word_cache_hits,
+            'word_cache_misses': self.word_cache_misses,
+            'async_conversions': self.async_conversions,
+            'async_cancelled': self.async_cancelled,
+            'async_convert_time_s': self.async_convert_time,
+            'completion_lookups': self.completion_lookups,
+            'completion_avg_us': average_us(self.completion_time, self.completion_lookups),
+            'history_flushes': self.history_flushes,
+            'history_flush_avg_ms': average_us(self.history_flush_time, self.history_flushes) / 1e3,
+            'history_load_ms': self.history_load_time * 1e3,
+        }
+
+    def dump(self, path):
+        """
+        Write the counters and timers to a JSON file
+
+        Args:
+            path: The file to write
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, indent=2)
+            f.write("\n")
+
+# The counters of this process
+STATS = PerfStats()
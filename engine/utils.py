@@ -14,16 +14,91 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-# Global variable to track verbose mode
+import logging
+import logging.handlers
+import os
+import sys
+
+# Global variable to track verbose mode. Hot paths check it before calling
+# debug_print so that nothing at all is done for their messages when it is off.
 VERBOSE_MODE = False
 
-def debug_print(*args, **kwargs):
+# Size of the log file before it is rotated, and number of old logs kept
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
+logger = logging.getLogger("ibus-buuz")
+
+def get_cache_dir():
+    """
+    Get the per-user cache directory of ibus-buuz
+
+    Returns:
+        The directory path; it may not exist yet
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "ibus-buuz")
+
+def get_data_dir():
+    """
+    Get the per-user data directory of ibus-buuz, for what it learns from
+    the user
+
+    Returns:
+        The directory path; it may not exist yet
+    """
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(data_home, "ibus-buuz")
+
+def default_log_path():
+    """Get the path of the log file written in verbose mode"""
+    return os.path.join(get_cache_dir(), "ibus-buuz.log")
+
+def setup_logging(verbose, log_file=None):
+    """
+    Configure debug logging
+
+    Args:
+        verbose: Whether debug messages are logged at all
+        log_file: The file to log to, "-" for standard error, or None for
+                  the default log file. Log files are rotated when they grow
+                  past LOG_MAX_BYTES. If the file cannot be written, messages
+                  go to standard error instead.
+    """
+    global VERBOSE_MODE
+    VERBOSE_MODE = verbose
+
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG if verbose else logging.WARNING)
+    if not verbose:
+        return
+
+    error = None
+    if log_file == "-":
+        handler = logging.StreamHandler(sys.stderr)
+    else:
+        log_file = log_file or default_log_path()
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+        except OSError as e:
+            # Logging is for debugging; it must not keep the engine from starting
+            error = e
+            handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    logger.addHandler(handler)
+    if error is not None:
+        logger.warning("Cannot write log file %s, logging to standard error: %s", log_file, error)
+
+def debug_print(msg, *args):
     """
-    Print debug messages only if verbose mode is enabled
+    Log a debug message only if verbose mode is enabled
 
     Args:
-        *args: Arguments to pass to print function
-        **kwargs: Keyword arguments to pass to print function
+        msg: The message, with %-style placeholders for args
+        *args: Values for the placeholders; the message is only formatted
+               when it is logged
     """
     if VERBOSE_MODE:
-        print(*args, **kwargs)
+        logger.debug(msg, *args)
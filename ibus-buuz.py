@@ -15,38 +15,116 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
+
+# Taken before anything else is imported, for --startup-profile
+_START_TIME = time.perf_counter()
+
 import os
 import sys
 import locale
 import getopt
+import signal
 
 # Add the engine directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), "engine"))
 
-import gi
-gi.require_version('IBus', '1.0')
-from gi.repository import IBus, GLib, GObject
-
-# Import our engine and utilities
-from engine import BuuzEngine
+# Import our utilities
 import utils
+from stats import STATS
+from utils import debug_print
 
 # Define constants
 BUUZ_ENGINE_PATH = "/org/freedesktop/IBus/Buuz/Engine/"
 BUUZ_ENGINE_NAME = "buuz"
 
+def import_ibus():
+    """
+    Import IBus and our engine. They are only needed when running under IBus,
+    so converting files works without PyGObject installed.
+    """
+    global IBus, GLib, GObject
+    import gi
+    gi.require_version('IBus', '1.0')
+    from gi.repository import IBus, GLib, GObject
+
+    # Importing the engine registers the BuuzEngine type
+    import engine
+
+class StartupProfile:
+    """
+    Measures how long each phase of startup takes, for --startup-profile
+    """
+    def __init__(self):
+        self.phases = []
+        self.last = _START_TIME
+
+    def mark(self, name):
+        """
+        End a startup phase
+
+        Args:
+            name: The name of the phase that just ended
+        """
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def report(self, out):
+        """
+        Print the duration of each phase
+
+        Args:
+            out: The output stream
+        """
+        before_script = _process_age()
+        if before_script is not None:
+            before_script -= time.perf_counter() - _START_TIME
+            print(f"{'interpreter startup':<28} {before_script * 1e3:8.1f} ms (approximate)", file=out)
+        for name, duration in self.phases:
+            print(f"{name:<28} {duration * 1e3:8.1f} ms", file=out)
+        print(f"{'total in script':<28} {(self.last - _START_TIME) * 1e3:8.1f} ms", file=out)
+
+def _process_age():
+    """
+    Get the time since this process started, from /proc
+
+    Returns:
+        The age in seconds (with clock tick resolution), or None if it is
+        not available
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the command name, which may contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
 class IMApp:
     """
     IBus IME Application
     """
-    def __init__(self):
+    def __init__(self, stats_file=None):
         self.bus = None
         self.engine = None
+        self.history = None
+        self.profiler = None
+        self._profile_timeout = None
         self.mainloop = GLib.MainLoop()
+        self.stats_file = stats_file or os.path.join(utils.get_cache_dir(), "stats.json")
 
-    def run(self):
+    def run(self, profile=None, profile_main_loop=False):
         """
         Run the application
+
+        Args:
+            profile: The StartupProfile to report before entering the main
+                     loop, if any
+            profile_main_loop: Whether to profile the main loop for the
+                               first PROFILE_DURATION seconds
         """
         # Initialize IBus connection
         IBus.init()
@@ -60,9 +138,101 @@ class IMApp:
         # Request the bus
         self.bus.request_name(f"org.freedesktop.IBus.Buuz", 0)
 
+        # Dump the performance counters when we get SIGUSR1
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR1, self._dump_stats_cb)
+
+        # Start or stop profiling when we get SIGUSR2
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR2, self._toggle_profile_cb)
+        if profile_main_loop:
+            self._toggle_profile_cb()
+
+        # The typing history is read once the main loop has nothing else to
+        # do, and written in batches; SIGTERM writes what is left
+        from history import get_history, HISTORY_FLUSH_INTERVAL
+        self.history = get_history()
+        if self.history is not None:
+            GLib.idle_add(self._load_history_cb, priority=GLib.PRIORITY_LOW)
+            GLib.timeout_add_seconds(HISTORY_FLUSH_INTERVAL, self._flush_history_cb)
+            GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGTERM, self._terminate_cb)
+
+        if profile:
+            profile.mark("IBus connection")
+            profile.report(sys.stderr)
+
         # Run the main loop
         self.mainloop.run()
 
+        if self.profiler is not None and self.profiler.running:
+            self._stop_profile()
+
+        if self.history is not None:
+            self.history.flush()
+
+    def _dump_stats_cb(self):
+        """
+        Callback for SIGUSR1, writes the performance counters to the stats file
+        """
+        try:
+            STATS.dump(self.stats_file)
+            debug_print("Performance counters written to %s", self.stats_file)
+        except OSError as e:
+            print(f"Failed to write {self.stats_file}: {e}", file=sys.stderr)
+        return GLib.SOURCE_CONTINUE
+
+    def _toggle_profile_cb(self):
+        """
+        Callback for SIGUSR2, starts profiling the main loop for
+        PROFILE_DURATION seconds, or stops a profile that is running
+        """
+        from profiler import MainLoopProfiler, PROFILE_DURATION
+        if self.profiler is None:
+            self.profiler = MainLoopProfiler()
+
+        if self.profiler.running:
+            GLib.source_remove(self._profile_timeout)
+            self._stop_profile()
+        else:
+            self.profiler.start()
+            self._profile_timeout = GLib.timeout_add_seconds(PROFILE_DURATION, self._profile_timeout_cb)
+        return GLib.SOURCE_CONTINUE
+
+    def _profile_timeout_cb(self):
+        """
+        Timeout callback that ends a profile after PROFILE_DURATION seconds
+        """
+        self._stop_profile()
+        return GLib.SOURCE_REMOVE
+
+    def _stop_profile(self):
+        """Stop profiling and write the profile"""
+        self._profile_timeout = None
+        try:
+            paths = self.profiler.stop()
+            print(f"Profile written to {' and '.join(paths)}", file=sys.stderr)
+        except OSError as e:
+            print(f"Failed to write profile: {e}", file=sys.stderr)
+
+    def _load_history_cb(self):
+        """
+        Idle callback that reads the typing history after startup
+        """
+        self.history.load()
+        return GLib.SOURCE_REMOVE
+
+    def _flush_history_cb(self):
+        """
+        Timeout callback that writes the words committed since the last one
+        """
+        self.history.flush()
+        return GLib.SOURCE_CONTINUE
+
+    def _terminate_cb(self):
+        """
+        Callback for SIGTERM, quits the main loop so the history is written
+        """
+        self.mainloop.quit()
+        return GLib.SOURCE_REMOVE
+
     def _bus_disconnected_cb(self, bus):
         """
         Callback for when the bus is disconnected
@@ -78,7 +248,25 @@ def print_help(out, v=0):
         v: Verbosity level
     """
     print("-i, --ibus             executed by IBus", file=out)
+    print("-c, --convert IN OUT   convert Latin text file IN to Cyrillic file OUT", file=out)
+    print("                       (use - for standard input or output)", file=out)
+    print("-j, --jobs N           convert with N worker processes", file=out)
+    print("    --chunk-size N     characters read at a time when converting", file=out)
+    print("-r, --rules FILE       use the conversion rules of FILE", file=out)
+    print("    --shared-rules     use the rules from a memory-mapped file shared", file=out)
+    print("                       by all ibus-buuz processes", file=out)
+    print("    --word-cache N     keep the conversions of N words (0 to disable)", file=out)
+    print("    --completion       show completion candidates from a word list", file=out)
+    print("    --words FILE       use the word list FILE for completion candidates", file=out)
+    print("    --no-history       do not record committed words to rank candidates", file=out)
     print("-v, --verbose          enable verbose debug output", file=out)
+    print("-l, --log-file FILE    write verbose output to FILE (- for standard error)", file=out)
+    print("                       instead of ~/.cache/ibus-buuz/ibus-buuz.log", file=out)
+    print("-s, --stats-file FILE  where SIGUSR1 writes performance counters", file=out)
+    print("                       (default ~/.cache/ibus-buuz/stats.json)", file=out)
+    print("    --startup-profile  report how long each phase of startup takes", file=out)
+    print("    --profile          profile the first minute of running; SIGUSR2", file=out)
+    print("                       starts or stops a profile at any time", file=out)
     print("-h, --help             show this help message", file=out)
     sys.exit(v)
 
@@ -86,10 +274,7 @@ def main():
     """
     Main function
     """
-    # Disable output buffering for debugging
-    sys.stdout = open(sys.stdout.fileno(), mode='w', buffering=1)
-    sys.stderr = open(sys.stderr.fileno(), mode='w', buffering=1)
-
+    profile = None
     try:
         locale.setlocale(locale.LC_ALL, "")
     except:
@@ -97,9 +282,22 @@ def main():
 
     # Parse command line options
     exec_by_ibus = False
+    verbose = False
+    log_file = None
+    stats_file = None
+    rule_file = None
+    shared_rules = False
+    word_cache_size = None
+    completion = False
+    word_list = None
+    history = True
+    convert_mode = False
+    jobs = 1
+    chunk_size = None
+    profile_main_loop = False
 
-    shortopt = "ivh"
-    longopt = ["ibus", "verbose", "help"]
+    shortopt = "icj:r:vl:s:h"
+    longopt = ["ibus", "convert", "jobs=", "chunk-size=", "rules=", "shared-rules", "word-cache=", "completion", "words=", "no-history", "verbose", "log-file=", "stats-file=", "startup-profile", "profile", "help"]
 
     try:
         opts, args = getopt.getopt(sys.argv[1:], shortopt, longopt)
@@ -111,19 +309,112 @@ def main():
             print_help(sys.stdout)
         elif o in ("-i", "--ibus"):
             exec_by_ibus = True
+        elif o in ("-c", "--convert"):
+            convert_mode = True
+        elif o in ("-j", "--jobs", "--chunk-size"):
+            try:
+                value = int(a)
+            except ValueError:
+                value = 0
+            if value < 1:
+                print(f"Invalid value for {o}: {a}\n", file=sys.stderr)
+                print_help(sys.stderr, 1)
+            if o == "--chunk-size":
+                chunk_size = value
+            else:
+                jobs = value
+        elif o in ("-r", "--rules"):
+            rule_file = a
+        elif o == "--shared-rules":
+            shared_rules = True
+        elif o == "--word-cache":
+            try:
+                word_cache_size = int(a)
+            except ValueError:
+                word_cache_size = -1
+            if word_cache_size < 0:
+                print(f"Invalid value for {o}: {a}\n", file=sys.stderr)
+                print_help(sys.stderr, 1)
+        elif o == "--completion":
+            completion = True
+        elif o == "--words":
+            completion = True
+            word_list = a
+        elif o == "--no-history":
+            history = False
         elif o in ("-v", "--verbose"):
-            utils.VERBOSE_MODE = True
+            verbose = True
+        elif o in ("-l", "--log-file"):
+            log_file = a
+        elif o in ("-s", "--stats-file"):
+            stats_file = a
+        elif o == "--profile":
+            profile_main_loop = True
+        elif o == "--startup-profile":
+            profile = StartupProfile()
+            profile.mark("script imports")
         else:
             print("Unknown argument: %s\n" % o, file=sys.stderr)
             print_help(sys.stderr, 1)
 
+    utils.setup_logging(verbose, log_file)
+
+    if rule_file:
+        from composer import set_rule_file
+        set_rule_file(rule_file)
+    if shared_rules:
+        from composer import set_mapped_rules
+        set_mapped_rules(True)
+    if word_cache_size is not None:
+        from composer import set_word_cache_size
+        set_word_cache_size(word_cache_size)
+
+    if convert_mode:
+        if len(args) != 2:
+            print_help(sys.stderr, 1)
+        import batch
+        try:
+            stats = batch.convert_file(args[0], args[1], jobs,
+                                       chunk_size or batch.DEFAULT_CHUNK_SIZE)
+        except (OSError, UnicodeError) as e:
+            print(f"Conversion failed: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(stats, file=sys.stderr)
+        return
+
     if not exec_by_ibus:
         print("This script is intended to be run by IBus.\n", file=sys.stderr)
         print_help(sys.stderr, 1)
 
+    if profile:
+        profile.mark("options and logging")
+
     # Create and run the application
-    app = IMApp()
-    app.run()
+    import_ibus()
+    if profile:
+        profile.mark("gi and engine imports")
+
+    # Load the rules now rather than when the first key is pressed
+    from composer import get_rule_table
+    get_rule_table()
+    if profile:
+        profile.mark("rule table")
+
+    # Map the word list for completion candidates, if enabled
+    if completion:
+        from completion import set_completion, get_word_index
+        set_completion(True, word_list)
+        get_word_index()
+
+        # Committed words rank the candidates; the history itself is read
+        # once the main loop runs
+        from history import set_history
+        set_history(history)
+        if profile:
+            profile.mark("word index")
+
+    app = IMApp(stats_file)
+    app.run(profile, profile_main_loop)
 
 if __name__ == "__main__":
     main()
@@ -18,6 +18,7 @@
 import os
 import sys
 import shutil
+import compileall
 import subprocess
 from setuptools import setup, find_packages
 
@@ -74,6 +75,9 @@ class CustomInstall:
         try:
             # Copy files
             self._copy_files()
+
+            # Prepare them for a fast start
+            self._precompile()
         except PermissionError:
             if self.mode == 'system':
                 print("Permission denied writing system files.")
@@ -89,7 +93,7 @@ class CustomInstall:
     def _copy_files(self):
         """Copy files to their destinations"""
         # Copy engine files
-        engine_files = ['engine.py', 'composer.py', 'utils.py']
+        engine_files = ['engine.py', 'composer.py', 'async_convert.py', 'batch.py', 'reverse.py', 'completion.py', 'history.py', 'profiler.py', 'stats.py', 'utils.py', 'mapped_table.py', 'fst.py', 'rules.txt']
         for file in engine_files:
             src = os.path.join('engine', file)
             dst = os.path.join(self.paths['lib_dir'], file)
@@ -128,6 +132,34 @@ class CustomInstall:
 
         print(f"Copied buuz.xml with absolute paths to {self.paths['component_dir']}/buuz.xml")
 
+    def _precompile(self):
+        """Byte-compile the Python files and compile the rule file"""
+        lib_dir = self.paths['lib_dir']
+
+        # The rule cache is written by the installed composer.py, in the
+        # format that copy reads
+        sys.path.insert(0, lib_dir)
+        try:
+            from composer import compile_rule_file, default_rule_file_path, default_rule_cache_path
+            cache_path = default_rule_cache_path()
+            table = compile_rule_file(default_rule_file_path(), cache_path)
+            print(f"Compiled {default_rule_file_path()} to {cache_path}")
+
+            from mapped_table import compile_rule_trie, default_rule_trie_path
+            trie_path = default_rule_trie_path()
+            compile_rule_trie(default_rule_file_path(), trie_path)
+            print(f"Compiled {default_rule_file_path()} to {trie_path}")
+
+            from fst import compile_fst, default_fst_path
+            fst_path = default_fst_path()
+            compile_fst(table).save(fst_path, table.digest)
+            print(f"Compiled {default_rule_file_path()} to {fst_path}")
+        finally:
+            sys.path.remove(lib_dir)
+
+        compileall.compile_dir(lib_dir, maxlevels=0, quiet=1)
+        print(f"Byte-compiled Python files in {lib_dir}")
+
     def _register_with_ibus(self):
         """Register the IME with IBus"""
         if self.mode == 'system':
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import os
+import tempfile
+import threading
+import time
+
+# Keep the caches the engine writes out of the user's home
+_tmp_home = tempfile.TemporaryDirectory()
+os.environ["XDG_CACHE_HOME"] = os.path.join(_tmp_home.name, "cache")
+os.environ["XDG_DATA_HOME"] = os.path.join(_tmp_home.name, "data")
+
+# Add the engine and bench directories to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "engine"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "bench"))
+
+import fake_ibus
+fake_ibus.install()
+
+from gi.repository import IBus
+from async_convert import ASYNC_MIN_LENGTH, AsyncConverter
+from composer import Composer
+from engine import BuuzEngine
+from stats import STATS
+
+SHORT_TEXT = "sain baina uu, Ulaanbaatar"
+LONG_TEXT = "buuz id'ye shine\n" * (ASYNC_MIN_LENGTH // 8)
+
+class MainLoop:
+    """A main loop that runs idle callbacks only when told to"""
+    def __init__(self):
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def idle_add(self, callback, *args):
+        with self.lock:
+            self.pending.append((callback, args))
+
+    def wait(self, timeout=30):
+        """Wait until a callback is added or no worker thread is left"""
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            with self.lock:
+                if self.pending:
+                    return
+            if not any(t.name == "buuz-convert" for t in threading.enumerate()):
+                return
+            time.sleep(0.01)
+
+    def run_pending(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+        for callback, args in pending:
+            callback(*args)
+
+def expected(text):
+    """Convert a text the way it would be typed"""
+    return "".join(Composer(word_cache=None).convert_stream((text,)))
+
+def run_tests():
+    """
+    Check that conversions are delivered from the main loop only, with the
+    right text, and never after they are cancelled
+    """
+    print("Checking conversions off the main loop...")
+    print("-" * 50)
+
+    passed = failed = 0
+    def check(name, ok):
+        nonlocal passed, failed
+        if ok:
+            passed += 1
+        else:
+            failed += 1
+            print(f"FAIL | {name}")
+
+    loop = MainLoop()
+    converter = AsyncConverter(idle_add=loop.idle_add)
+
+    # Short texts are converted at once, but delivered like the others
+    results = []
+    converter.convert(SHORT_TEXT, results.append)
+    check("short text is not delivered before the main loop runs", results == [])
+    loop.run_pending()
+    check("short text is delivered", results == [expected(SHORT_TEXT)])
+
+    # Long texts are converted by the worker, whose conversions are counted
+    # only once they are delivered
+    results = []
+    chars_before = STATS.chars_converted
+    converter.convert(LONG_TEXT, results.append)
+    loop.wait()
+    check("worker does not count in STATS", STATS.chars_converted == chars_before)
+    check("long text is not delivered before the main loop runs", results == [])
+    loop.run_pending()
+    check("conversion is counted when delivered", STATS.chars_converted > chars_before)
+    check("long text is delivered", results == [expected(LONG_TEXT)])
+    check("converter is idle after delivery", not converter.busy)
+
+    # Cancelled jobs are never delivered, whether the worker finished or not
+    for when in ("while converting", "before delivery"):
+        results = []
+        converter.convert(LONG_TEXT, results.append)
+        if when == "before delivery":
+            loop.wait()
+        converter.cancel()
+        loop.wait()
+        loop.run_pending()
+        check(f"job cancelled {when} is not delivered", results == [])
+    results = []
+    converter.convert(SHORT_TEXT, results.append)
+    converter.cancel()
+    loop.run_pending()
+    check("short job cancelled before delivery is not delivered", results == [])
+
+    # A new job drops the one before
+    first, second = [], []
+    converter.convert(LONG_TEXT, first.append)
+    converter.convert(SHORT_TEXT, second.append)
+    loop.wait()
+    loop.run_pending()
+    check("replaced job is not delivered", first == [])
+    check("new job is delivered", second == [expected(SHORT_TEXT)])
+
+    # F9 converts the selection of a client that tells its surrounding text
+    engine = BuuzEngine()
+    engine._async_converter = AsyncConverter(engine.composer.table, loop.idle_add)
+    engine.surrounding_text = ("Mongol " + SHORT_TEXT, 7, 7 + len(SHORT_TEXT))
+    check("F9 without the capability is let through",
+          not engine.do_process_key_event(IBus.KEY_F9, 0, 0))
+    engine.do_set_capabilities(IBus.Capabilite.SURROUNDING_TEXT)
+    check("F9 with a selection is handled", engine.do_process_key_event(IBus.KEY_F9, 0, 0))
+    loop.run_pending()
+    check("selection is replaced", engine.committed == [expected(SHORT_TEXT)])
+
+    engine.committed = []
+    engine.do_process_key_event(IBus.KEY_F9, 0, 0)
+    engine.surrounding_text = ("Mongol " + SHORT_TEXT, 3, 3)
+    loop.run_pending()
+    check("changed selection is not replaced", engine.committed == [])
+
+    check("F9 without a selection is let through",
+          not engine.do_process_key_event(IBus.KEY_F9, 0, 0))
+
+    print("-" * 50)
+    print(f"Results: {passed} passed, {failed} failed")
+
+    return failed == 0
+
+if __name__ == "__main__":
+    success = run_tests()
+    sys.exit(0 if success else 1)
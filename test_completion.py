@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import random
+import sys
+import tempfile
+
+# Keep the caches the engine writes out of the user's home
+_tmp_home = tempfile.TemporaryDirectory()
+os.environ["XDG_CACHE_HOME"] = os.path.join(_tmp_home.name, "cache")
+os.environ["XDG_DATA_HOME"] = os.path.join(_tmp_home.name, "data")
+
+# Add the engine directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "engine"))
+
+import completion
+from completion import WordIndex, save_word_index
+
+# Letters of the random words; few, so that prefixes are shared by many words
+ALPHABET = "абвгдэөүх"
+
+def expected_candidates(counts, prefix, count):
+    """Find the candidates of a prefix by looking at every word"""
+    words = [word for word in counts if word.startswith(prefix) and word != prefix]
+    words.sort(key=lambda word: -counts[word])
+    return [counts[word] for word in words[:count]]
+
+def run_tests(count=2000, seed=None):
+    """
+    Check the candidates of a word index against all words of its list
+
+    Args:
+        count: The number of random prefixes
+        seed: The random seed; a random one if None
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    rnd = random.Random(seed)
+
+    # Make prefixes hot with a small list, so that both ways of finding
+    # candidates are checked
+    completion.MAX_SCAN_WORDS = 64
+
+    counts = {}
+    for _ in range(5000):
+        word = "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(1, 8)))
+        counts[word] = rnd.randint(1, 1000000)
+
+    print(f"Checking completion candidates of {count} random prefixes (seed {seed})...")
+    print("-" * 50)
+
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "words.idx")
+        digest = bytes(32)
+        save_word_index(counts, path, digest)
+        index = WordIndex(path, digest)
+
+        for _ in range(count):
+            prefix = "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(1, 4)))
+            # Narrow the range of a shorter prefix, as the engine does
+            within = index.find_prefix(prefix[:rnd.randint(1, len(prefix))])
+            # Candidates are compared by count, since words of the same
+            # count may come in any order
+            result = [counts[word] for word in index.candidates(index.find_prefix(prefix, within))]
+            expected = expected_candidates(counts, prefix, completion.MAX_CANDIDATES)
+            if result != expected:
+                failed += 1
+                if failed <= 10:
+                    print(f"FAIL | Prefix: {prefix!r} | Expected: {expected} | Got: {result}")
+
+    print("-" * 50)
+    print(f"Results: {count - failed} passed, {failed} failed")
+
+    return failed == 0
+
+if __name__ == "__main__":
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    success = run_tests(seed=seed)
+    sys.exit(0 if success else 1)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import os
+import tempfile
+
+# Keep the caches the engine writes out of the user's home
+_tmp_home = tempfile.TemporaryDirectory()
+os.environ["XDG_CACHE_HOME"] = os.path.join(_tmp_home.name, "cache")
+os.environ["XDG_DATA_HOME"] = os.path.join(_tmp_home.name, "data")
+
+# Add the engine and bench directories to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "engine"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "bench"))
+
+import fake_ibus
+fake_ibus.install()
+
+from gi.repository import IBus
+from composer import Composer
+from engine import AUTO_COMMIT_LENGTH, BuuzEngine
+
+def type_keys(engine, keys, state=0):
+    """Press and release each key of a string with the given modifiers"""
+    for char in keys:
+        engine.do_process_key_event(ord(char), 0, state)
+        engine.do_process_key_event(ord(char), 0, state | IBus.ModifierType.RELEASE_MASK)
+
+def run_tests():
+    """
+    Check how key presses with modifiers compose, commit or pass through
+    """
+    print("Checking key handling...")
+    print("-" * 50)
+
+    passed = failed = 0
+    def check(name, ok):
+        nonlocal passed, failed
+        if ok:
+            passed += 1
+        else:
+            failed += 1
+            print(f"FAIL | {name}")
+
+    # Num Lock and Caps Lock leave their modifiers on while typing
+    for name, keys, state, preedit in (
+            ("no modifiers", "sh", 0, "ш"),
+            ("Shift", "SH", IBus.ModifierType.SHIFT_MASK, "Ш"),
+            ("Num Lock", "sh", IBus.ModifierType.MOD2_MASK, "ш"),
+            ("Caps Lock", "SH", IBus.ModifierType.LOCK_MASK, "Ш"),
+            ("Num Lock and Caps Lock", "SH", IBus.ModifierType.MOD2_MASK | IBus.ModifierType.LOCK_MASK, "Ш")):
+        engine = BuuzEngine()
+        type_keys(engine, keys, state)
+        check(f"letters typed with {name} are composed",
+              engine.preedit_text == preedit and engine.is_composing)
+        check(f"letters typed with {name} commit nothing", engine.committed == [])
+
+    # Shortcuts are let through, and commit the composition first
+    engine = BuuzEngine()
+    type_keys(engine, "sh")
+    check("Ctrl+letter is let through",
+          not engine.do_process_key_event(ord("c"), 0, IBus.ModifierType.CONTROL_MASK))
+    check("Ctrl+letter commits the composition", engine.committed == ["ш"] and not engine.is_composing)
+
+    engine = BuuzEngine()
+    type_keys(engine, "sh")
+    check("Ctrl+letter with Num Lock is let through",
+          not engine.do_process_key_event(ord("c"), 0, IBus.ModifierType.CONTROL_MASK | IBus.ModifierType.MOD2_MASK))
+    check("Ctrl+letter with Num Lock commits the composition", engine.committed == ["ш"])
+
+    # Once a long word is partly committed and the rest of it is erased,
+    # what is typed next converts as a new word, not with the word flags of
+    # the committed part
+    long_word = ("delgerengui" * 8)[:AUTO_COMMIT_LENGTH + 5]
+    for word in ("buuz", "sh", "delgereh"):
+        engine = BuuzEngine()
+        type_keys(engine, long_word)
+        check("long word is partly committed", engine.committed != [])
+        for _ in range(len(engine.composer.input_text)):
+            engine.do_process_key_event(IBus.KEY_BackSpace, 0, 0)
+        check("erasing the rest ends the composition", not engine.is_composing)
+        type_keys(engine, word)
+        check(f"{word!r} typed after erasing converts as a new word",
+              engine.preedit_text == Composer(word_cache=None).convert(word))
+
+    print("-" * 50)
+    print(f"Results: {passed} passed, {failed} failed")
+
+    return failed == 0
+
+if __name__ == "__main__":
+    success = run_tests()
+    sys.exit(0 if success else 1)
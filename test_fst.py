@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import sys
+import os
+import tempfile
+
+# Keep the caches the engine writes out of the user's home
+_tmp_home = tempfile.TemporaryDirectory()
+os.environ["XDG_CACHE_HOME"] = os.path.join(_tmp_home.name, "cache")
+os.environ["XDG_DATA_HOME"] = os.path.join(_tmp_home.name, "data")
+
+# Add the engine directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "engine"))
+
+from composer import X_M, get_rule_table
+from fst import compile_fst, read_fst
+
+# Characters of the random inputs: Latin letters and the quotes that rules
+# are made of, Cyrillic letters that some rules convert, and characters
+# that no rule uses
+ALPHABET = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'\"АОУЭӨҮИаоуэөүи .,1\n"
+
+# Characters that are unambiguous wherever no input is pending, which long
+# inputs are mostly made of so that they are converted in bulk
+UNAMBIGUOUS = "bdfghjlmnprtvxzBDM 0123456789|-.\n"
+
+def reference_convert(table, text):
+    """Convert with the conversion loop of the rule table"""
+    result = []
+    table.convert_into(text, 0, len(text), X_M, result)
+    return "".join(result)
+
+def random_text(rnd):
+    """Make a random input, mostly short, sometimes long and mostly unambiguous"""
+    if rnd.random() < 0.01:
+        chars = [rnd.choice(ALPHABET if rnd.random() < 0.2 else UNAMBIGUOUS)
+                 for _ in range(rnd.randint(256, 10000))]
+    else:
+        # Mostly short words, with some longer texts of several words
+        length = rnd.choice((rnd.randint(0, 8), rnd.randint(0, 40)))
+        chars = [rnd.choice(ALPHABET) for _ in range(length)]
+    return "".join(chars)
+
+def run_tests(count=20000, seed=None):
+    """
+    Check the transducer, as compiled and as saved and mapped back, against
+    the rule table on random inputs
+
+    Args:
+        count: The number of random inputs
+        seed: The random seed; a random one if None
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    rnd = random.Random(seed)
+
+    table = get_rule_table()
+    fst = compile_fst(table)
+    digest = bytes(32)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "rules.fst")
+        fst.save(path, digest)
+        mapped = read_fst(path, digest)
+    if mapped is None:
+        print("FAIL | The saved transducer cannot be read back")
+        return False
+
+    print(f"Comparing the transducer with the rule table on {count} random inputs (seed {seed})...")
+    print("-" * 50)
+
+    failed = 0
+    for _ in range(count):
+        text = random_text(rnd)
+        expected = reference_convert(table, text)
+        result = fst.convert(text)
+        if result == expected:
+            result = mapped.convert(text)
+        if result != expected:
+            failed += 1
+            if failed <= 10:
+                print(f"FAIL | Input: {text[:60]!r} ({len(text)} characters) | Expected: {expected[:60]!r}")
+
+    print("-" * 50)
+    print(f"Results: {count - failed} passed, {failed} failed")
+
+    return failed == 0
+
+if __name__ == "__main__":
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    success = run_tests(seed=seed)
+    sys.exit(0 if success else 1)
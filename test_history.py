@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import random
+import sys
+import tempfile
+
+# Add the engine and bench directories to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "engine"))
+sys.path.append(os.path.join(os.path.dirname(__file__), "bench"))
+
+import fake_ibus
+fake_ibus.install()
+
+from gi.repository import IBus
+import completion
+import history
+from history import TypingHistory
+
+# Letters of the random words; few, so that prefixes are shared by many words
+ALPHABET = "абвгдэөүх"
+
+def read_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read().split("\n")[:-1]
+
+def run_tests(count=2000, seed=None):
+    """
+    Check that the typing history log survives torn lines, restarts and
+    compaction, and the completions and candidates it ranks
+
+    Args:
+        count: The number of random words recorded
+        seed: The random seed; a random one if None
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    rnd = random.Random(seed)
+
+    print(f"Checking the typing history with {count} random words (seed {seed})...")
+    print("-" * 50)
+
+    passed = failed = 0
+    def check(name, ok):
+        nonlocal passed, failed
+        if ok:
+            passed += 1
+        else:
+            failed += 1
+            print(f"FAIL | {name}")
+
+    compact_extra_lines = history.COMPACT_EXTRA_LINES
+    cache_min_matches = history.CACHE_MIN_MATCHES
+    environ = {name: os.environ.get(name) for name in ("XDG_CACHE_HOME", "XDG_DATA_HOME")}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # The word index and rule caches the engine builds go there too
+        os.environ["XDG_CACHE_HOME"] = os.path.join(tmp_dir, "cache")
+        os.environ["XDG_DATA_HOME"] = os.path.join(tmp_dir, "data")
+        try:
+            path = os.path.join(tmp_dir, "history.log")
+
+            # A line cut short by a crash is skipped
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write("3\tбууз\n2\tшин")
+            h = TypingHistory(path)
+            h.load()
+            check("whole line is read", h.count("бууз") == 3)
+            check("torn last line is skipped", h.count("шин") == 0)
+
+            # The torn line is ended before the next append, so that it does
+            # not run into the appended line, and stays skipped
+            h.record("шинэ")
+            check("flush succeeds", h.flush())
+            check("torn line is ended with a tab", read_lines(path) == ["3\tбууз", "2\tшин\t", "1\tшинэ"])
+            h = TypingHistory(path)
+            h.load()
+            check("repaired torn line is skipped", h.count("шин") == 0 and h.count("шинэ") == 1)
+
+            # Words flushed before the log is loaded are counted once
+            h = TypingHistory(path)
+            h.record("бууз")
+            h.flush()
+            h.record("бууз")
+            h.load()
+            check("flush before load does not double-count", h.count("бууз") == 5)
+            h.flush()
+            h = TypingHistory(path)
+            h.load()
+            check("counts survive a restart", h.count("бууз") == 5 and h.count("шинэ") == 1)
+
+            # The log is compacted once it has COMPACT_EXTRA_LINES more lines
+            # than words
+            history.COMPACT_EXTRA_LINES = 20
+            os.remove(path)
+            h = TypingHistory(path)
+            h.load()
+            words = ["".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(1, 6))) for _ in range(count)]
+            expected = {}
+            compactions = 0
+            for word in words:
+                h.record(word)
+                expected[word] = expected.get(word, 0) + 1
+                lines_before = len(read_lines(path)) if os.path.exists(path) else 0
+                h.flush()
+                lines = len(read_lines(path))
+                if lines_before + 1 > len(expected) + history.COMPACT_EXTRA_LINES:
+                    compactions += 1
+                    check("compacted log has one line per word", lines == len(expected))
+                else:
+                    check("log is appended to", lines == lines_before + 1)
+            check("log is compacted", compactions > 0)
+            h = TypingHistory(path)
+            h.load()
+            check("counts survive compaction", all(h.count(word) == n for word, n in expected.items()))
+
+            # Completions are the words committed most with the prefix; those
+            # of short prefixes are kept until a word with the prefix is
+            # recorded
+            history.CACHE_MIN_MATCHES = 16
+            for _ in range(100):
+                prefix = "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(1, 2)))
+                for _ in range(2):
+                    matches = [n for word, n in expected.items() if word.startswith(prefix) and word != prefix]
+                    result = [expected[word] for word in h.completions(prefix, 9)]
+                    check(f"completions of {prefix!r}", result == sorted(matches, reverse=True)[:9])
+                    word = prefix + rnd.choice(ALPHABET)
+                    for _ in range(rnd.randint(1, 50)):
+                        h.record(word)
+                        expected[word] = expected.get(word, 0) + 1
+
+            # Words the user commits often are candidates even if the word
+            # index ranks them too low to return them
+            word_list = os.path.join(tmp_dir, "words.txt")
+            with open(word_list, 'w', encoding='utf-8') as f:
+                for k in range(20):
+                    f.write(f"бууз{ALPHABET[k % 9]}{k}\t{1000 - k}\n")
+            completion.set_completion(True, word_list)
+            history.set_history(True, os.path.join(tmp_dir, "engine.log"))
+            for word in ("буузх19", "буузх19", "буузнууд"):
+                history.get_history().record(word)
+
+            from engine import BuuzEngine
+            engine = BuuzEngine()
+            for char in "buuz":
+                engine.do_process_key_event(ord(char), 0, 0)
+            check("committed words come first", engine.candidates[:2] == ["буузх19", "буузнууд"])
+            check("index words fill the rest", engine.candidates[2:] == [f"бууз{ALPHABET[k % 9]}{k}" for k in range(7)])
+
+            # Words committed in password and PIN fields are not recorded,
+            # whether typed or picked from the candidates
+            for purpose, recorded in ((IBus.InputPurpose.FREE_FORM, 1),
+                                      (IBus.InputPurpose.PASSWORD, 0),
+                                      (IBus.InputPurpose.PIN, 0)):
+                for commit_key in (IBus.KEY_space, IBus.KEY_1):
+                    engine = BuuzEngine()
+                    engine.do_set_content_type(purpose, 0)
+                    for char in "buuz":
+                        engine.do_process_key_event(ord(char), 0, 0)
+                    word = engine.preedit_text if commit_key == IBus.KEY_space else engine.candidates[0]
+                    count = history.get_history().count(word)
+                    engine.do_process_key_event(commit_key, 0, 0)
+                    check(f"word committed with purpose {purpose} is recorded {recorded} times",
+                          engine.committed == [word] and history.get_history().count(word) == count + recorded)
+        finally:
+            history.COMPACT_EXTRA_LINES = compact_extra_lines
+            history.CACHE_MIN_MATCHES = cache_min_matches
+            for name, value in environ.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+    print("-" * 50)
+    print(f"Results: {passed} passed, {failed} failed")
+
+    return failed == 0
+
+if __name__ == "__main__":
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    success = run_tests(seed=seed)
+    sys.exit(0 if success else 1)
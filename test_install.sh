@@ -21,6 +21,8 @@ if [ -f ~/.local/bin/ibus-buuz ] && \
    [ -f ~/.local/share/ibus-buuz/ibus-buuz.py ] && \
    [ -f ~/.local/share/ibus-buuz/engine.py ] && \
    [ -f ~/.local/share/ibus-buuz/composer.py ] && \
+   [ -f ~/.local/share/ibus-buuz/rules.cache ] && \
+   [ -f ~/.local/share/ibus-buuz/rules.txt ] && \
    [ -f ~/.local/share/ibus-buuz/icons/buuz.png ] && \
    [ -f ~/.local/share/ibus/component/buuz.xml ]; then
     echo "✓ Files copied successfully"
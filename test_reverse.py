@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright 2009-2025 Odbayar Nyamtseren <odbayar.n@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import re
+import sys
+import os
+import tempfile
+
+# Keep the caches the engine writes out of the user's home
+_tmp_home = tempfile.TemporaryDirectory()
+os.environ["XDG_CACHE_HOME"] = os.path.join(_tmp_home.name, "cache")
+os.environ["XDG_DATA_HOME"] = os.path.join(_tmp_home.name, "data")
+
+# Add the engine directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(__file__), "engine"))
+
+from composer import Composer
+from reverse import ReverseConverter
+
+# Characters of the random inputs: Latin letters and the quotes that rules
+# are made of, and characters that no rule uses
+ALPHABET = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'\" .,1\n"
+
+# Cyrillic texts and the Latin they convert back to
+TEST_CASES = [
+    ("бууз идье", "buuz id'ye"),
+    ("дэлгэрэх", "delgereh"),
+    ("Улаанбаатар", "Ulaanbaatar"),
+    ("шинэ", "shine"),
+    ("схема", "sxyema"),
+    ("өглөө", "qgloo"),
+    # Inputs chosen earlier are taken back when nothing fits after them
+    ("эүь", "ew'"),
+    ("э үь", "e w'"),
+    ("эЙУ", "eI\"U"),
+]
+
+# Texts with Latin words in them, and what they convert back to: a Latin
+# letter is copied as is, and the Cyrillic around it still converts back
+MIXED_CASES = [
+    ("бууз x шинэ дэлгэр", "buuz x shine delger"),
+    ("iPad бууз шинэ", "iPad buuz shine"),
+    ("Linux дээр GNU", "Linux deer GNU"),
+]
+
+# Latin words put between the conversions of random inputs; each letter
+# converts to a single Cyrillic letter on its own
+LATIN_WORDS = ("x", "iPad", "Linux", "GNU")
+
+# Every conversion of Latin input has a Latin input, so none of these may
+# be left in what a conversion converts back to
+CYRILLIC_RE = re.compile("[\u0400-\u04ff]")
+
+def mixed_text_ok(text, result, composer):
+    """
+    Check the conversion back of a text with Latin words: it has no Cyrillic
+    left, and converting it again gives the text back but for the Latin
+    letters
+    """
+    if CYRILLIC_RE.search(result):
+        return False
+    again = composer.convert(result)
+    return len(again) == len(text) and all(
+        a == b for a, b in zip(text, again) if not (a.isascii() and a.isalpha()))
+
+def run_tests(count=5000, seed=None):
+    """
+    Check that converting back to Latin and converting again gives the same
+    Cyrillic text, on known texts and on the conversions of random inputs,
+    that the conversions of random inputs convert back to Latin only, and
+    that Latin words in the text leave the Cyrillic around them converted
+
+    Args:
+        count: The number of random inputs
+        seed: The random seed; a random one if None
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    rnd = random.Random(seed)
+
+    composer = Composer(word_cache=None)
+    reverse = ReverseConverter()
+
+    print(f"Converting back to Latin, {len(TEST_CASES)} known texts and {count} random inputs (seed {seed})...")
+    print("-" * 50)
+
+    failed = 0
+    for cyrillic, expected in TEST_CASES:
+        result = reverse.convert(cyrillic)
+        if result != expected or composer.convert(result) != cyrillic:
+            failed += 1
+            print(f"FAIL | Text: {cyrillic!r} | Expected: {expected!r} | Got: {result!r}")
+
+    for text, expected in MIXED_CASES:
+        result = reverse.convert(text)
+        if result != expected or not mixed_text_ok(text, result, composer):
+            failed += 1
+            print(f"FAIL | Text: {text!r} | Expected: {expected!r} | Got: {result!r}")
+
+    # Long texts, in which a Latin word must not affect the conversion of
+    # the rest of the text
+    long_count = 20
+    for _ in range(long_count):
+        parts = []
+        while sum(map(len, parts)) < 32768:
+            latin = "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(0, 400)))
+            parts.append(composer.convert(latin))
+            parts.append(f" {rnd.choice(LATIN_WORDS)} ")
+        text = "".join(parts)
+        result = reverse.convert(text)
+        if not mixed_text_ok(text, result, composer):
+            failed += 1
+            print(f"FAIL | Long text of {len(text)} characters | Got: {result[:60]!r}")
+
+    texts = []
+    for _ in range(count):
+        length = rnd.choice((rnd.randint(0, 8), rnd.randint(0, 40), rnd.randint(0, 400)))
+        texts.append(composer.convert("".join(rnd.choice(ALPHABET) for _ in range(length))))
+
+    for text, result in zip(texts, reverse.convert_batch(texts)):
+        if composer.convert(result) != text or CYRILLIC_RE.search(result):
+            failed += 1
+            if failed <= 10:
+                print(f"FAIL | Text: {text[:60]!r} | Got: {result[:60]!r}")
+
+    total = len(TEST_CASES) + len(MIXED_CASES) + long_count + count
+    print("-" * 50)
+    print(f"Results: {total - failed} passed, {failed} failed")
+
+    return failed == 0
+
+if __name__ == "__main__":
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    success = run_tests(seed=seed)
+    sys.exit(0 if success else 1)
@@ -17,6 +17,12 @@
 
 import sys
 import os
+import tempfile
+
+# Keep the caches the engine writes out of the user's home
+_tmp_home = tempfile.TemporaryDirectory()
+os.environ["XDG_CACHE_HOME"] = os.path.join(_tmp_home.name, "cache")
+os.environ["XDG_DATA_HOME"] = os.path.join(_tmp_home.name, "data")
 
 # Add the engine directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), "engine"))
@@ -110,6 +116,50 @@ def run_tests():
 
         print(f"Test {i:2d}: {status} | Input: '{input_text}' | Expected: '{expected}' | Got: '{result}'")
 
+    # Type each test input one character at a time, then erase it again, and
+    # check that the live composition always matches a full conversion
+    for i, (input_text, expected) in enumerate(test_cases, len(test_cases) + 1):
+        composer.reset()
+        ok = True
+        for char in input_text:
+            ok = ok and composer.append(char) == composer.convert(composer.input_text)
+        ok = ok and composer.output_text == expected
+        while composer.input_text:
+            ok = ok and composer.backspace() == composer.convert(composer.input_text)
+
+        if ok:
+            status = "PASS"
+            passed += 1
+        else:
+            status = "FAIL"
+            failed += 1
+
+        print(f"Test {i:2d}: {status} | Typed: '{input_text}' | Expected: '{expected}'")
+
+    # Type long inputs without spaces, taking the settled beginning of the
+    # composition away after each character as the engine does, and check
+    # that what was taken and what is left make up a full conversion
+    long_inputs = [
+        "Ulaanbaataryn'hothondoo'rshinjilgeenii'ajilhiijbaina" * 3,
+        "delgereh" * 10,
+        "dorjdelgerehbuuzid'ye" * 5,
+    ]
+    for i, input_text in enumerate(long_inputs, 2 * len(test_cases) + 1):
+        composer.reset()
+        settled = []
+        for char in input_text:
+            composer.append(char)
+            settled.append(composer.take_settled(4))
+
+        if "".join(settled) + composer.output_text == composer.convert(input_text):
+            status = "PASS"
+            passed += 1
+        else:
+            status = "FAIL"
+            failed += 1
+
+        print(f"Test {i:2d}: {status} | Typed with auto-commit: '{input_text[:20]}...'")
+
     print("-" * 50)
     print(f"Results: {passed} passed, {failed} failed")
 